@@ -11,3 +11,12 @@ def make_datestring(year, month, day):
 
 def filename_from_url(url):
     return quote(url, safe='')
+
+def format_statistics(statistics):
+    """
+    Given counters by key and name, returns one line per key, e.g.
+    "sniff: 12 cached, 3 local, 5 requested".
+    """
+    return ''.join('%s: %s\n' % (key, ', '.join(
+        '%d %s' % (count, name) for name, count in sorted(counts.items())
+    )) for key, counts in sorted(statistics.items()))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import link, path, remove, rename
+from shutil import copyfile
+from threading import Lock
+
+import sqlite3
+
+from config import ensure_directory_exists
+
+def link_file(source_filename, filename):
+    """
+    Puts a hard link to a file in place at filename, or a copy if the
+    file system does not allow hard links, replacing any file there.
+    """
+    # renaming a link to the file it links to would do nothing
+    if path.exists(filename) and path.samefile(filename, source_filename):
+        return
+    temporary_filename = filename + '.link'
+    if path.exists(temporary_filename):
+        remove(temporary_filename)
+    try:
+        link(source_filename, temporary_filename)
+    except OSError:  # no hard links across file systems
+        copyfile(source_filename, temporary_filename)
+    rename(temporary_filename, filename)
+
+class BlobStore(object):
+    """
+    Media files stored once by the SHA-256 hex digest of their contents,
+    as directory/<first two digits>/<digest>, along with an SQLite
+    database of the digest of every URL downloaded for any source and the
+    source and URL each blob was first downloaded from. Files in source
+    directories are hard links to blobs. A store may be shared by threads.
+    """
+    def __init__(self, directory, filename):
+        self.directory = directory
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, ' +
+            'size INTEGER, source TEXT, url TEXT)'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, ' +
+            'sha256 TEXT)'
+        )
+        self.db.commit()
+
+    def _get_blob_path(self, digest):
+        return path.join(self.directory, digest[:2], digest)
+
+    def get(self, url):
+        """
+        Returns SHA-256 hex digest and size of the blob downloaded from
+        url, or None if there is none.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT blobs.sha256, size FROM urls JOIN blobs ' +
+                'ON urls.sha256 = blobs.sha256 WHERE urls.url = ?', (url,)
+            ).fetchone()
+        if row is None or not path.exists(self._get_blob_path(row[0])):
+            return None
+        return row
+
+    def get_first(self, digest):
+        """
+        Returns source and URL the blob with the given SHA-256 hex digest
+        was first downloaded from, or None if there is no such blob.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT source, url FROM blobs WHERE sha256 = ?', (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        return tuple(row)
+
+    def link(self, digest, filename):
+        """
+        Puts a blob in place at filename.
+        """
+        link_file(self._get_blob_path(digest), filename)
+
+    def add(self, filename, digest, size, source, url):
+        """
+        Stores a downloaded file as a blob, unless a blob with the same
+        contents exists, in which case filename is replaced by a link to
+        it. Returns source and URL the blob was first downloaded from.
+        """
+        blob_path = self._get_blob_path(digest)
+        with self.lock:
+            row = self.db.execute(
+                'SELECT source, url FROM blobs WHERE sha256 = ?', (digest,)
+            ).fetchone()
+            if row is None:
+                self.db.execute(
+                    'INSERT INTO blobs VALUES (?, ?, ?, ?)',
+                    (digest, size, source, url)
+                )
+                row = (source, url)
+            self.db.execute(
+                'INSERT OR REPLACE INTO urls VALUES (?, ?)', (url, digest)
+            )
+            if not path.exists(blob_path):
+                ensure_directory_exists(path.dirname(blob_path))
+                try:
+                    link(filename, blob_path)
+                except OSError:  # no hard links across file systems
+                    copyfile(filename, blob_path + '.tmp')
+                    rename(blob_path + '.tmp', blob_path)
+            self.db.commit()
+        self.link(digest, filename)
+        return tuple(row)
+
+    def close(self):
+        self.db.close()
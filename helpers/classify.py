@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from posixpath import splitext
+from urllib2 import urlparse
+
+from autovividict import autovividict
+
+# Reported MIME types that may be given for audio or video resources,
+# besides any audio or video type.
+_MEDIA_MIMETYPES = frozenset(['audio', 'video'])
+_AMBIGUOUS_MIMETYPES = frozenset([
+    'application/octet-stream',  # general binary MIME type
+    'application/ogg',
+    'application/mp4',
+    'application/x-shockwave-flash'
+])
+
+# Counters of classified materials, e.g. statistics['classify']['extension'].
+statistics = autovividict()
+
+def get_extension(url):
+    return splitext(urlparse.urlsplit(url).path)[1][1:].lower()
+
+def get_doi_prefix(doi):
+    if doi is None:
+        return None
+    return doi.split('/')[0]
+
+def get_trusted_publishers(checked_materials, min_checked, max_misreported):
+    """
+    Given DOI, MIME type and reported MIME type of materials whose MIME
+    type was checked, returns the DOI prefixes of publishers that report
+    MIME types correctly, judged as by “oa-cache stats”: publishers with
+    at least min_checked materials, of which at most a max_misreported
+    share were misreported.
+    """
+    correct = autovividict()
+    incorrect = autovividict()
+    for doi, mimetype, mimetype_reported in checked_materials:
+        doi_prefix = get_doi_prefix(doi)
+        if mimetype == 'application/msword':  # MS Office guessed by extension
+            continue
+        if mimetype != mimetype_reported:
+            incorrect[doi_prefix] += 1
+        else:
+            correct[doi_prefix] += 1
+    trusted = set()
+    for doi_prefix in correct.keys():
+        checked = correct[doi_prefix] + incorrect.get(doi_prefix, 0)
+        if checked >= min_checked and \
+            incorrect.get(doi_prefix, 0) <= max_misreported * checked:
+            trusted.add(doi_prefix)
+    return trusted
+
+class Classifier(object):
+    """
+    Decides which materials could be audio or video resources, so that
+    only these have their MIME type checked over the network. For other
+    materials, the reported MIME type is taken as it is.
+
+    A material has to be checked if its reported MIME type or its URL
+    extension is one of audio or video. It does not have to be checked if
+    its extension is one of non_media_extensions or if it was published
+    by a publisher whose DOI prefix is in trusted_publishers.
+    """
+    def __init__(self, media_extensions, non_media_extensions,
+        trusted_publishers):
+        self.media_extensions = frozenset(media_extensions)
+        self.non_media_extensions = frozenset(non_media_extensions)
+        self.trusted_publishers = frozenset(trusted_publishers)
+
+    def needs_check(self, mimetype, mime_subtype, url, doi):
+        extension = get_extension(url)
+        if mimetype in _MEDIA_MIMETYPES or \
+            mimetype + '/' + mime_subtype in _AMBIGUOUS_MIMETYPES or \
+            extension in self.media_extensions:
+            statistics['classify']['checked'] += 1
+            return True
+        if extension in self.non_media_extensions:
+            statistics['classify']['extension'] += 1
+            return False
+        if get_doi_prefix(doi) in self.trusted_publishers:
+            statistics['classify']['publisher'] += 1
+            return False
+        statistics['classify']['checked'] += 1
+        return True
@@ -14,6 +14,12 @@ data_path = path.join(BaseDirectory.xdg_data_home, APPLICATION_NAME)
 def database_path(source):
     return path.join(data_path, '%s.sqlite' % source)
 
+def ledger_path(source):
+    return path.join(data_path, '%s-ledger.sqlite' % source)
+
+# digests of media files downloaded for all sources
+blobs_database_path = path.join(data_path, 'blobs.sqlite')
+
 def ensure_directory_exists(directory):
     if not path.exists(directory):
         makedirs(directory)
@@ -43,6 +49,12 @@ def get_media_raw_source_path(source_name):
     ensure_directory_exists(p)
     return p
 
+# media files of all sources by digest, see helpers.blobs
+_media_blobs_path = path.join(_media_path, 'blobs')
+def get_media_blobs_path():
+    ensure_directory_exists(_media_blobs_path)
+    return _media_blobs_path
+
 _media_refined_path = path.join(_media_path, 'refined')
 def get_media_refined_source_path(source_name):
     p = path.join(_media_refined_path, source_name)
@@ -79,7 +91,90 @@ def get_userconfig(section, option):
                          (userconfig_file, option, section))
         exit(127)
 
+def get_userconfig_default(section, option, default):
+    try:
+        return userconfig.get(section, option)
+    except (NoSectionError, NoOptionError):
+        return default
+
 api_url = get_userconfig('wiki', 'api_url')
 username = get_userconfig('wiki', 'username')
 password = get_userconfig('wiki', 'password')
 whitelist_doi = get_userconfig('whitelist', 'doi').split()
+
+# number of processes parsing articles in find-media, 1 disables parallel mode
+processes = int(get_userconfig_default('performance', 'processes', 1))
+
+# “memory” keeps names of known articles in a set, “disk” in a Bloom
+# filter and index below the refined metadata directory
+seen_set = get_userconfig_default('performance', 'seen-set', 'memory')
+seen_set_capacity = int(
+    get_userconfig_default('performance', 'seen-set-capacity', 4000000)
+)
+
+# number of connections used for each file in “oa-get download-metadata pmc”
+download_connections = int(
+    get_userconfig_default('performance', 'download-connections', 4)
+)
+
+# number of connections “oa-get update-mimetypes” checks MIME types over,
+# and how many of them may go to the same host
+sniff_connections = int(
+    get_userconfig_default('performance', 'sniff-connections', 16)
+)
+sniff_connections_per_host = int(
+    get_userconfig_default('performance', 'sniff-connections-per-host', 4)
+)
+# most bytes of a file read to detect its MIME type
+sniff_max_size = int(
+    get_userconfig_default('performance', 'sniff-max-size', 1048576)
+)
+
+# number of media files “oa-get download-media” downloads at a time, and
+# how many of them may come from the same host
+media_connections = int(
+    get_userconfig_default('performance', 'media-connections', 8)
+)
+media_connections_per_host = int(
+    get_userconfig_default('performance', 'media-connections-per-host', 2)
+)
+# most bytes per second read by “oa-get download-media”, 0 means no limit
+media_max_rate = int(
+    get_userconfig_default('performance', 'media-max-rate', 0)
+)
+# number of times a failed media download is tried again
+media_retries = int(
+    get_userconfig_default('performance', 'media-retries', 3)
+)
+
+# materials “oa-get update-mimetypes” checks over the network: those with
+# audio or video URL extensions always, those with non-media extensions
+# never, others unless the publisher (DOI prefix) reported MIME types
+# correctly for enough materials checked before
+media_extensions = get_userconfig_default('mimetypes', 'media-extensions',
+    'aac aif aiff avi flac flv m4a m4v mkv mov mp3 mp4 mpeg mpg oga ogg ' +
+    'ogv opus qt swf wav webm wma wmv 3gp').split()
+non_media_extensions = get_userconfig_default('mimetypes', 'non-media-extensions',
+    'bmp csv doc docx eps gif gz htm html jpeg jpg pdf png ppt pptx rtf svg ' +
+    'tar tif tiff tsv txt xls xlsx xml zip').split()
+publisher_min_checked = int(
+    get_userconfig_default('mimetypes', 'publisher-min-checked', 50)
+)
+publisher_max_misreported = float(
+    get_userconfig_default('mimetypes', 'publisher-max-misreported', 0.01)
+)
+
+# “bulk” adds articles in find-media with batched INSERT statements,
+# “orm” with a query per journal, article, category and material
+ingest = get_userconfig_default('performance', 'ingest', 'bulk')
+ingest_commit_interval = int(
+    get_userconfig_default('performance', 'ingest-commit-interval', 1000)
+)
+
+# maximum size in bytes of cached E-utilities responses, 0 disables the cache
+eutils_cache_size = int(
+    get_userconfig_default('performance', 'eutils-cache-size', 268435456)
+)
+
+# NCBI API key, allowing more requests per second to E-utilities
+ncbi_api_key = get_userconfig_default('ncbi', 'api_key', None)
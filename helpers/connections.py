@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from threading import BoundedSemaphore, Lock
+from urllib2 import urlparse, HTTPError
+
+import socket
+
+MAX_DISCARDED = 65536  # bytes of a body read to keep a connection open
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+TIMEOUT = 60
+USER_AGENT = 'oa-get/2012-07-21'
+
+class Response(object):
+    """
+    Response to a request sent by a connection pool. Closing it hands
+    the connection back to the pool if the body was read completely and
+    the server keeps the connection open, or else closes the connection.
+    """
+    def __init__(self, pool, key, connection, response, url):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+
+    def read(self, size=None):
+        if size is None:
+            return self.response.read()
+        return self.response.read(size)
+
+    def discard(self):
+        """
+        Closes the response without using its body.
+        """
+        if self.connection is not None:
+            self.response.read(MAX_DISCARDED)
+        self.close()
+
+    def close(self):
+        if self.connection is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool._release(self.key, self.connection)
+        else:
+            self.connection.close()
+            self.pool._release(self.key, None)
+        self.connection = None
+
+class ConnectionPool(object):
+    """
+    HTTP connections that are kept open for further requests to the same
+    host, with at most per_host requests to a host at a time. A request
+    waits until a connection to its host is free. A pool may be shared by
+    threads.
+    """
+    def __init__(self, per_host, timeout=TIMEOUT, user_agent=USER_AGENT):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.lock = Lock()
+        self.idle = {}  # (scheme, host) → connections not in use
+        self.semaphores = {}  # (scheme, host) → free requests
+
+    def _get_semaphore(self, key):
+        with self.lock:
+            if key not in self.semaphores:
+                self.semaphores[key] = BoundedSemaphore(self.per_host)
+            return self.semaphores[key]
+
+    def _connect(self, key):
+        """
+        Returns an idle connection to a host and whether it was used
+        before, or a new connection.
+        """
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host = key
+        if scheme == 'https':
+            return HTTPSConnection(host, timeout=self.timeout), False
+        return HTTPConnection(host, timeout=self.timeout), False
+
+    def _release(self, key, connection):
+        if connection is not None:
+            with self.lock:
+                self.idle.setdefault(key, []).append(connection)
+        self._get_semaphore(key).release()
+
+    def _request(self, key, target, headers):
+        while True:
+            connection, reused = self._connect(key)
+            try:
+                connection.request('GET', target, headers=headers)
+                return connection, connection.getresponse()
+            except (HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                # server closed the idle connection, try another one
+
+    def open(self, url, headers={}):
+        """
+        Sends a GET request for url, following redirects, and returns the
+        response. Raises HTTPError for error responses.
+        """
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        request_headers = {'User-Agent': self.user_agent}
+        request_headers.update(headers)
+        for redirect in xrange(MAX_REDIRECTS + 1):
+            scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+            if scheme not in ('http', 'https'):
+                raise HTTPError(url, 400, 'Unsupported URL scheme', {}, None)
+            key = (scheme, netloc.lower())
+            target = urlparse.urlunsplit(('', '', path or '/', query, ''))
+            self._get_semaphore(key).acquire()
+            try:
+                connection, response = self._request(key, target, request_headers)
+            except:
+                self._release(key, None)
+                raise
+            result = Response(self, key, connection, response, url)
+            location = response.getheader('location')
+            if response.status in REDIRECT_CODES and location is not None:
+                result.discard()
+                url = urlparse.urljoin(url, location)
+                continue
+            if response.status >= 400:
+                result.discard()
+                raise HTTPError(url, response.status, response.reason,
+                    response.msg, None)
+            return result
+        raise HTTPError(url, response.status, 'Too many redirects',
+            response.msg, None)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
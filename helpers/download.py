@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from hashlib import md5, sha256
+from httplib import HTTPException
+from os import path, remove, rename
+from threading import Thread
+from time import sleep
+from urllib2 import urlopen, urlparse, Request, HTTPError, URLError
+
+import json
+import re
+import socket
+
+from token_bucket import TokenBucket
+
+BUFSIZE = 1024000  # (1024KB)
+RETRIES = 5
+RETRY_CODES = (408, 429, 500, 502, 503, 504)  # worth trying again later
+USER_AGENT = 'oa-get/2012-07-21'
+
+def get_published_md5(url):
+    """
+    Returns the MD5 checksum published next to a file as url + '.md5',
+    or None if there is none.
+    """
+    request = Request(url + '.md5', None, {'User-Agent': USER_AGENT})
+    try:
+        match = re.search('[0-9a-fA-F]{32}', urlopen(request).read())
+    except (HTTPError, URLError):
+        return None
+    if match is not None:
+        return match.group(0).lower()
+
+def get_local_md5(local_filename):
+    """
+    Returns the MD5 checksum of a local file, as recorded next to it in
+    local_filename + '.md5' or, if not recorded yet, computed and recorded.
+    """
+    checksum_filename = local_filename + '.md5'
+    try:
+        with open(checksum_filename) as checksum_file:
+            return checksum_file.read().strip()
+    except IOError:  # checksum was not recorded
+        pass
+    digest = md5()
+    with open(local_filename, 'rb') as local_file:
+        for chunk in iter(lambda: local_file.read(BUFSIZE), ''):
+            digest.update(chunk)
+    set_local_md5(local_filename, digest.hexdigest())
+    return digest.hexdigest()
+
+def set_local_md5(local_filename, checksum):
+    with open(local_filename + '.md5', 'w') as checksum_file:
+        checksum_file.write(checksum + '\n')
+
+def _get_total(url):
+    """
+    Returns size of a remote file and whether its server accepts range
+    requests.
+    """
+    request = Request(url, None, {'User-Agent': USER_AGENT})
+    request.headers['Range'] = 'bytes=0-0'
+    remote_file = urlopen(request)
+    try:
+        if remote_file.getcode() == 206:  # Partial Content
+            content_range = remote_file.headers['content-range']
+            return int(content_range.split('/')[-1]), True
+        return int(remote_file.headers['content-length']), False
+    finally:
+        remote_file.close()
+
+class SegmentedDownload(object):
+    """
+    Downloads a file over several connections, each fetching a byte
+    range into its place in a partial file.
+
+    Progress of every range is stored next to the partial file, so that
+    an interrupted download continues where it stopped. The MD5 digest
+    is computed while the download runs, following the part of the file
+    that is complete from its start.
+    """
+    def __init__(self, url, local_filename, segments=4):
+        self.url = url
+        self.local_filename = local_filename
+        self.part_filename = local_filename + '.part'
+        self.state_filename = self.part_filename + '.json'
+        self.segments = segments
+        self.total, self.accepts_ranges = _get_total(url)
+        self.errors = []
+        self.digest = md5()
+        self.digested = 0
+        self.ranges = []
+        self.threads = []
+
+    def _load_state(self):
+        """
+        Returns byte ranges of an earlier attempt as lists of start, end
+        and bytes completed, or None if it cannot be resumed.
+        """
+        if not self.accepts_ranges:
+            return None
+        try:
+            with open(self.state_filename) as state_file:
+                state = json.load(state_file)
+            if state['url'] != self.url or state['total'] != self.total or \
+                path.getsize(self.part_filename) != self.total:
+                return None
+            return state['ranges']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def save_state(self):
+        with open(self.state_filename + '.tmp', 'w') as state_file:
+            json.dump({
+                'url': self.url,
+                'total': self.total,
+                'ranges': self.ranges
+            }, state_file)
+        rename(self.state_filename + '.tmp', self.state_filename)
+
+    def _fetch(self, byte_range):
+        """
+        Fetches a byte range into the partial file, retrying after errors
+        and short reads. A server that does not accept range requests
+        sends the whole file every time, so it is then written again from
+        the start of the range.
+        """
+        failures = 0
+        start, end = byte_range[0], byte_range[1]
+        while start + byte_range[2] < end:
+            request = Request(self.url, None, {'User-Agent': USER_AGENT})
+            if self.accepts_ranges:
+                request.headers['Range'] = 'bytes=%s-%s' % \
+                    (start + byte_range[2], end - 1)
+            else:
+                byte_range[2] = 0
+            try:
+                remote_file = urlopen(request, timeout=60)
+                if self.accepts_ranges and remote_file.getcode() != 206:
+                    raise HTTPException, \
+                        'Range request for <%s> answered with status %d.' % \
+                        (self.url, remote_file.getcode())
+                with open(self.part_filename, 'r+b') as part_file:
+                    part_file.seek(start + byte_range[2])
+                    while start + byte_range[2] < end:
+                        chunk = remote_file.read(
+                            min(BUFSIZE, end - start - byte_range[2])
+                        )
+                        if chunk == '':
+                            raise HTTPException, \
+                                'Connection for <%s> closed early.' % self.url
+                        part_file.write(chunk)
+                        part_file.flush()
+                        byte_range[2] += len(chunk)
+                        if self.accepts_ranges:  # progress is kept
+                            failures = 0
+            except (HTTPError, URLError, HTTPException, IOError), e:
+                failures += 1
+                if failures > RETRIES:
+                    self.errors.append(str(e))
+                    return
+                sleep(2 ** failures)
+
+    def start(self):
+        self.ranges = self._load_state()
+        if self.ranges is None:
+            segments = self.segments
+            if not self.accepts_ranges:
+                segments = 1
+            size = max(1, -(-self.total // segments))  # rounded up
+            self.ranges = [
+                [start, min(start + size, self.total), 0] \
+                    for start in xrange(0, self.total, size)
+            ]
+            with open(self.part_filename, 'wb') as part_file:
+                part_file.truncate(self.total)
+            self.save_state()
+        for byte_range in self.ranges:
+            thread = Thread(target=self._fetch, args=(byte_range,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def completed(self):
+        return sum(byte_range[2] for byte_range in self.ranges)
+
+    def update_digest(self):
+        """
+        Adds the data completed from the start of the file since the
+        last call to the digest.
+        """
+        with open(self.part_filename, 'rb') as part_file:
+            part_file.seek(self.digested)
+            for start, end, completed in self.ranges:
+                if self.digested >= end:
+                    continue
+                while self.digested < start + completed:
+                    chunk = part_file.read(
+                        min(BUFSIZE, start + completed - self.digested)
+                    )
+                    self.digest.update(chunk)
+                    self.digested += len(chunk)
+                if start + completed < end:
+                    break
+
+    def finish(self, expected_md5=None):
+        """
+        Checks a finished download and moves it into place, returning
+        its MD5 digest. A download not matching expected_md5 is removed.
+        """
+        self.save_state()
+        if self.errors:
+            raise RuntimeError, 'Downloading <%s> failed: %s' % \
+                (self.url, self.errors[-1])
+        self.update_digest()
+        if self.digested != self.total:
+            raise RuntimeError, 'Download of <%s> is incomplete.' % self.url
+        digest = self.digest.hexdigest()
+        if expected_md5 is not None and digest != expected_md5:
+            remove(self.part_filename)
+            remove(self.state_filename)
+            raise RuntimeError, \
+                'Download of <%s> has MD5 checksum %s, expected %s.' % \
+                (self.url, digest, expected_md5)
+        rename(self.part_filename, self.local_filename)
+        remove(self.state_filename)
+        return digest
+
+def interleave_by_host(urls):
+    """
+    Returns URLs in an order that alternates between their hosts, so that
+    workers downloading them in order do not all wait for the same host.
+    """
+    urls_by_host = OrderedDict()
+    for url in urls:
+        host = urlparse.urlsplit(url).netloc.lower()
+        urls_by_host.setdefault(host, []).append(url)
+    interleaved = []
+    for i in xrange(max([len(host_urls) for host_urls in urls_by_host.values()] or [0])):
+        for host_urls in urls_by_host.values():
+            if i < len(host_urls):
+                interleaved.append(host_urls[i])
+    return interleaved
+
+def _get_sha256(filename, digest=None):
+    """
+    Returns a SHA-256 digest updated with the contents of a file.
+    """
+    if digest is None:
+        digest = sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(BUFSIZE), ''):
+            digest.update(chunk)
+    return digest
+
+def _get_size(headers):
+    """
+    Returns the size of a remote file as given in response headers, or
+    None if it is not known.
+    """
+    content_range = headers.getheader('content-range')
+    if content_range is not None:
+        total = content_range.split('/')[-1]
+    else:
+        total = headers.getheader('content-length')
+    try:
+        return int(total)
+    except (TypeError, ValueError):
+        return None
+
+def _fetch_media(connections, url, local_filename, bucket):
+    # a file in place was downloaded completely, unless it was written by
+    # an earlier version that did not use partial files; if local file has
+    # same size as remote file, skip download
+    if path.exists(local_filename):
+        response = connections.open(url, {'Range': 'bytes=0-0'})
+        total = _get_size(response.headers)
+        response.discard()
+        if total == path.getsize(local_filename):
+            return False, total, _get_sha256(local_filename).hexdigest()
+
+    # an interrupted download is resumed where it stopped
+    part_filename = local_filename + '.part'
+    completed = 0
+    headers = {}
+    if path.exists(part_filename):
+        completed = path.getsize(part_filename)
+        headers['Range'] = 'bytes=%d-' % completed
+    try:
+        response = connections.open(url, headers)
+    except HTTPError, e:
+        if e.code != 416:  # Requested Range Not Satisfiable
+            raise
+        total = _get_size(e.hdrs)
+        if total != completed:  # remote file changed, start again
+            remove(part_filename)
+            raise HTTPException, 'Partial file does not match <%s>' % url
+        response = None
+    try:
+        if response is None:  # partial file is complete
+            digest = _get_sha256(part_filename)
+        elif response.status == 206:  # Partial Content
+            content_range = response.headers.getheader('content-range')
+            try:  # e.g. “bytes 1000-9999/10000”
+                start = int(content_range.split()[1].split('-')[0])
+            except (AttributeError, IndexError, ValueError):
+                raise HTTPException, 'Invalid range %s for <%s>' % \
+                    (content_range, url)
+            if start != completed:
+                raise HTTPException, 'Unexpected range %s for <%s>' % \
+                    (content_range, url)
+            digest = _get_sha256(part_filename)
+            mode = 'ab'
+        else:  # server ignored the range
+            completed = 0
+            digest = sha256()
+            mode = 'wb'
+        if response is not None:
+            total = _get_size(response.headers)
+            with open(part_filename, mode) as part_file:
+                while True:
+                    chunk = response.read(BUFSIZE)
+                    if chunk == '':
+                        break
+                    bucket.take(len(chunk))
+                    part_file.write(chunk)
+                    digest.update(chunk)
+                    completed += len(chunk)
+    finally:
+        if response is not None:
+            response.close()
+    if total is not None and completed != total:
+        raise HTTPException, 'Received %d of %d bytes of <%s>' % \
+            (completed, total, url)
+    rename(part_filename, local_filename)
+    return True, completed, digest.hexdigest()
+
+def fetch_media(connections, url, local_filename, bucket, retries=RETRIES):
+    """
+    Downloads a media file over a connection pool, reading no faster than
+    the token bucket allows. The file is written next to local_filename
+    with the suffix .part and moved into place once its length matches
+    the one the server gave. Failed attempts are retried after a growing
+    delay, continuing where they stopped if the server accepts range
+    requests. Returns whether the file was downloaded, as it may be in
+    place already, its size and its SHA-256 hex digest.
+    """
+    for attempt in xrange(retries + 1):
+        try:
+            return _fetch_media(connections, url, local_filename, bucket)
+        except HTTPError, e:
+            if e.code not in RETRY_CODES or attempt == retries:
+                raise
+        except (HTTPException, socket.error):
+            if attempt == retries:
+                raise
+        sleep(2 ** attempt)
@@ -1,19 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from urllib2 import urlopen, urlparse, Request, HTTPError
-from xml.etree.cElementTree import dump, ElementTree
+from urllib2 import urlopen, urlparse, quote, Request, HTTPError
+from xml.etree.cElementTree import dump, ElementTree, iterparse
 from sys import stderr
 
+import eutils
+
 def _get_file_from_url(url):
-    req = Request(url, None, {'User-Agent' : 'oa-put/2012-08-15'})
-    try:
-        remote_file = urlopen(req)
-        return remote_file
-    except HTTPError as e:
-        stderr.write('When trying to download <%s>, the following error occured: “%s”.\n' % \
-            (url, str(e)))
-        exit(255)
+    return eutils.get_file_from_url(url, 'oa-put/2012-08-15')
 
 def get_pmcid_from_doi(doi):
     if not type(doi) == unicode:
@@ -39,21 +34,108 @@ def get_pmid_from_doi(doi):
     except AttributeError:
         return None
 
-def get_categories_from_pmid(pmid):
+# Number of DOIs looked up with a single query.
+DOI_BATCH_SIZE = 100
+
+def _get_uids_from_dois(db, dois):
     """
-    Gets MeSH headings, returns those not deemed too broad.
+    Given a database and DOIs, returns a dictionary mapping each found DOI
+    (in lower case, as DOIs are case insensitive) to its ID in the database.
+
+    A single esearch query finds the IDs of all DOIs; esummary then tells
+    which ID belongs to which DOI.
     """
-    if not type(pmid) == int:
-        raise TypeError, "Cannot get Categories for PMID %s of type %s." % (pmid, type(pmid))
-    url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id=%s&retmode=xml' % pmid
+    url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=%s&retmax=%d&term=%s' % \
+        (db, 2 * len(dois), quote(' OR '.join([doi + '[doi]' for doi in dois]).encode('utf-8')))
     xml_file = _get_file_from_url(url)
     tree = ElementTree()
     tree.parse(xml_file)
+    uids = [e.text for e in tree.iterfind('IdList/Id')]
+    if len(uids) == 0:
+        return {}
+
+    url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=%s&id=%s' % \
+        (db, ','.join(uids))
+    xml_file = _get_file_from_url(url)
+    tree = ElementTree()
+    tree.parse(xml_file)
+    result = {}
+    for summary in tree.iterfind('DocSum'):
+        uid = int(summary.find('Id').text)
+        for doi in summary.iterfind("Item[@Name='ArticleIds']/Item[@Name='doi']"):
+            if doi.text is not None:
+                result.setdefault(doi.text.strip().lower(), uid)
+    return result
+
+def get_ids_from_dois(dois):
+    """
+    Given DOIs, returns a dictionary mapping each DOI to a tuple of its
+    PMID and PMCID; either is None if it was not found.
+
+    DOIs are looked up in batches, with four queries per batch instead
+    of two for every DOI.
+    """
+    ids = {}
+    dois = list(set(dois))
+    for i in xrange(0, len(dois), DOI_BATCH_SIZE):
+        batch = dois[i:i + DOI_BATCH_SIZE]
+        for doi in batch:
+            if not type(doi) == unicode:
+                raise TypeError, "Cannot get IDs for DOI %s of type %s." % (doi, type(doi))
+        pmids = _get_uids_from_dois('pubmed', batch)
+        pmcids = _get_uids_from_dois('pmc', batch)
+        for doi in batch:
+            ids[doi] = pmids.get(doi.lower()), pmcids.get(doi.lower())
+    return ids
+
+# Number of PMIDs whose MeSH headings are fetched with a single request.
+PMID_BATCH_SIZE = 200
+
+def _get_categories_from_article(article):
+    """
+    Given a <PubmedArticle> element, returns MeSH headings not deemed too
+    broad.
+    """
     categories = []
-    for heading in tree.iterfind('PubmedArticle/MedlineCitation/MeshHeadingList/MeshHeading'):
+    for heading in article.iterfind('MedlineCitation/MeshHeadingList/MeshHeading'):
         htree = ElementTree(heading)
         descriptor_text = htree.find('DescriptorName').text
         if (htree.find('QualifierName') is not None) or \
             (' ' in descriptor_text and not 'and' in descriptor_text):
             categories.append(descriptor_text)
     return categories
+
+def get_categories_from_pmids(pmids):
+    """
+    Gets MeSH headings for PMIDs, returns a dictionary mapping every PMID
+    found to the headings not deemed too broad.
+
+    Headings are fetched for many PMIDs with a single request; responses
+    are parsed incrementally, one <PubmedArticle> element at a time.
+    """
+    categories = {}
+    pmids = list(set(pmids))
+    for i in xrange(0, len(pmids), PMID_BATCH_SIZE):
+        batch = pmids[i:i + PMID_BATCH_SIZE]
+        for pmid in batch:
+            if not type(pmid) == int:
+                raise TypeError, "Cannot get Categories for PMID %s of type %s." % (pmid, type(pmid))
+        url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id=%s&retmode=xml' % \
+            ','.join([str(pmid) for pmid in batch])
+        xml_file = _get_file_from_url(url)
+        for event, element in iterparse(xml_file):
+            if element.tag == 'PubmedArticle':
+                pmid = int(element.find('MedlineCitation/PMID').text)
+                categories[pmid] = _get_categories_from_article(element)
+                element.clear()
+            elif element.tag == 'PubmedBookArticle':
+                element.clear()
+    return categories
+
+def get_categories_from_pmid(pmid):
+    """
+    Gets MeSH headings, returns those not deemed too broad.
+    """
+    if not type(pmid) == int:
+        raise TypeError, "Cannot get Categories for PMID %s of type %s." % (pmid, type(pmid))
+    return get_categories_from_pmids([pmid]).get(pmid, [])
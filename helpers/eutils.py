@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from os import path, rename
+from sys import exit, stderr
+from threading import Lock
+from time import time
+from urllib import urlencode
+from urllib2 import urlparse, HTTPError, URLError
+
+import sqlite3
+
+import config
+import ncbi
+from autovividict import autovividict
+
+# Seconds a cached response is used for, by E-utilities endpoint. Search
+# results change as articles are added; fetched records rarely change.
+TTLS = {
+    'esearch': 24 * 60 * 60,
+    'esummary': 7 * 24 * 60 * 60,
+    'efetch': 30 * 24 * 60 * 60
+}
+DEFAULT_TTL = 24 * 60 * 60
+
+# Query parameters that do not change a response. Responses to queries
+# on the history server (WebEnv) are not cached at all.
+_IGNORED_PARAMETERS = frozenset(['api_key', 'email', 'tool'])
+
+# Counters of cache lookups, e.g. statistics['eutils-cache']['hits'].
+statistics = autovividict()
+
+class ResponseCache(object):
+    """
+    Responses of E-utilities, stored in an SQLite database by normalised
+    query. Responses expire after the TTL of their endpoint. If the
+    responses take up more than max_size bytes, the least recently used
+    ones are removed; responses larger than that are not stored at all.
+    A cache may be shared by threads.
+
+    The size of all responses is kept as a running total in the database,
+    updated along with the responses, so that processes sharing the
+    database agree on it without summing up all responses.
+    """
+    def __init__(self, filename, max_size):
+        self.max_size = max_size
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, ' +
+            'endpoint TEXT, fetched REAL, accessed REAL, size INTEGER, body BLOB)'
+        )
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)'
+        )
+        self.db.execute('CREATE TABLE IF NOT EXISTS total (size INTEGER)')
+        if self.db.execute('SELECT 1 FROM total').fetchone() is None:
+            self.db.execute(
+                'INSERT INTO total SELECT IFNULL(SUM(size), 0) FROM responses'
+            )
+        self.db.commit()
+
+    def get_size(self):
+        """
+        Returns the size of all cached responses.
+        """
+        with self.lock:
+            return self._get_size()
+
+    def _get_size(self):
+        return self.db.execute('SELECT size FROM total').fetchone()[0]
+
+    def _add_size(self, size):
+        self.db.execute('UPDATE total SET size = size + ?', (size,))
+
+    def get(self, key, endpoint):
+        """
+        Returns the cached response for a key, or None if there is no
+        response that is still valid.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body, fetched FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                statistics['eutils-cache']['misses'] += 1
+                return None
+            body, fetched = row
+            if time() - fetched > TTLS.get(endpoint, DEFAULT_TTL):
+                statistics['eutils-cache']['expired'] += 1
+                return None
+            self.db.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?', (time(), key)
+            )
+            self.db.commit()
+            statistics['eutils-cache']['hits'] += 1
+            return str(body)
+
+    def put(self, key, endpoint, body):
+        if len(body) > self.max_size:
+            statistics['eutils-cache']['oversized'] += 1
+            return
+        now = time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:  # response is replaced
+                self._add_size(-row[0])
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, endpoint, now, now, len(body), sqlite3.Binary(body))
+            )
+            self._add_size(len(body))
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        size = self._get_size()
+        if size <= self.max_size:
+            return
+        rows = self.db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed'
+        )
+        evicted = []
+        evicted_size = 0
+        for key, response_size in rows:
+            evicted.append((key,))
+            evicted_size += response_size
+            if size - evicted_size <= self.max_size:
+                break
+        self.db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        self._add_size(-evicted_size)
+        statistics['eutils-cache']['evicted'] += len(evicted)
+
+_cache = None
+_cache_lock = Lock()
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                path.join(config.cache_path, 'eutils.sqlite'),
+                config.eutils_cache_size
+            )
+    return _cache
+
+def _get_key(url):
+    """
+    Given an E-utilities URL, returns endpoint and normalised query, or
+    None for both if the response must not be cached.
+    """
+    scheme, netloc, url_path, query, fragment = urlparse.urlsplit(url)
+    parameters = urlparse.parse_qsl(query, keep_blank_values=True)
+    if 'WebEnv' in [name for name, value in parameters]:
+        return None, None
+    endpoint = url_path.split('/')[-1].split('.')[0]
+    query = urlencode(sorted(
+        (name, value) for name, value in parameters \
+            if name not in _IGNORED_PARAMETERS
+    ))
+    return endpoint, netloc.lower() + url_path + '?' + query
+
+def get_file_from_url(url, user_agent):
+    """
+    Returns a file-like object holding the response to an E-utilities
+    URL, taken from the response cache if possible or else requested
+    through the NCBI scheduler. Responses larger than the cache are not
+    cached. Exits if the request fails.
+    """
+    endpoint, key = _get_key(url)
+    use_cache = key is not None and config.eutils_cache_size > 0
+    if use_cache:
+        body = _get_cache().get(key, endpoint)
+        if body is not None:
+            return StringIO(body)
+
+    body = _fetch(url, None, user_agent)
+    if use_cache:
+        _get_cache().put(key, endpoint, body)
+    return StringIO(body)
+
+def fetch_to_file(url, filename, user_agent):
+    """
+    Writes the response to an E-utilities URL into a file, taken from the
+    response cache if possible or else streamed into the file through the
+    NCBI scheduler. Responses larger than the cache are not cached. Other
+    than get_file_from_url, raises HTTPError or URLError if the request
+    fails, so that it can be used by worker threads.
+    """
+    endpoint, key = _get_key(url)
+    use_cache = key is not None and config.eutils_cache_size > 0
+    if use_cache:
+        body = _get_cache().get(key, endpoint)
+        if body is not None:
+            with open(filename + '.part', 'wb') as part_file:
+                part_file.write(body)
+            rename(filename + '.part', filename)
+            return
+
+    ncbi.get_scheduler().fetch_to_file(url, filename, user_agent=user_agent)
+    if use_cache and path.getsize(filename) <= config.eutils_cache_size:
+        with open(filename, 'rb') as f:
+            _get_cache().put(key, endpoint, f.read())
+
+def get_file_from_post(url, parameters, user_agent):
+    """
+    Returns a file-like object holding the response to an E-utilities
+    URL, with parameters sent in the request body so that they are not
+    limited by the length of a URL. Such responses are not cached. Exits
+    if the request fails.
+    """
+    return StringIO(_fetch(url, urlencode(parameters), user_agent))
+
+def _fetch(url, data, user_agent):
+    try:
+        return ncbi.get_scheduler().fetch(url, data, user_agent=user_agent)
+    except (HTTPError, URLError) as e:
+        stderr.write('When trying to download <%s>, the following error occured: “%s”.\n' % \
+            (url, str(e)))
+        exit(255)
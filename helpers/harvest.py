@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+
+import sqlite3
+
+class HarvestState(object):
+    """
+    Progress of listing articles from the PubMed Central OA web service,
+    stored in an SQLite database so that an interrupted listing can be
+    resumed. A state may be shared by threads.
+
+    The dates to list are split into partitions. For every partition, the
+    URL of the next page to request is stored along with the IDs listed
+    so far; a partition without a next URL is complete. IDs listed on a
+    page are committed together with the URL of the following page.
+    """
+    def __init__(self, filename):
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS partitions (date_from TEXT, ' +
+            'date_until TEXT, url TEXT, PRIMARY KEY (date_from, date_until))'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS ids (id TEXT, date_from TEXT, ' +
+            'date_until TEXT, PRIMARY KEY (id, date_from, date_until))'
+        )
+        self.db.commit()
+
+    def add_partition(self, date_from, date_until, url):
+        """
+        Adds a partition starting at url, unless it exists already.
+        """
+        with self.lock:
+            self.db.execute(
+                'INSERT OR IGNORE INTO partitions VALUES (?, ?, ?)',
+                (date_from, date_until, url)
+            )
+            self.db.commit()
+
+    def remove_partition(self, date_from, date_until):
+        """
+        Removes a partition and the IDs listed for it.
+        """
+        with self.lock:
+            self.db.execute(
+                'DELETE FROM ids WHERE date_from = ? AND date_until = ?',
+                (date_from, date_until)
+            )
+            self.db.execute(
+                'DELETE FROM partitions WHERE date_from = ? AND date_until = ?',
+                (date_from, date_until)
+            )
+            self.db.commit()
+
+    def get_url(self, date_from, date_until):
+        """
+        Returns the URL of the next page of a partition, or None if the
+        partition is complete.
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT url FROM partitions ' +
+                'WHERE date_from = ? AND date_until = ?',
+                (date_from, date_until)
+            ).fetchone()[0]
+
+    def put_page(self, date_from, date_until, ids, url):
+        """
+        Stores IDs listed on a page of a partition and the URL of the
+        next page, which is None if it was the last page.
+        """
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO ids VALUES (?, ?, ?)',
+                [(id, date_from, date_until) for id in ids]
+            )
+            self.db.execute(
+                'UPDATE partitions SET url = ? ' +
+                'WHERE date_from = ? AND date_until = ?',
+                (url, date_from, date_until)
+            )
+            self.db.commit()
+
+    def get_ids(self, date_from, date_until):
+        """
+        Returns IDs listed for a partition, in the order they were listed.
+        """
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT id FROM ids WHERE date_from = ? AND date_until = ? ' +
+                'ORDER BY rowid',
+                (date_from, date_until)
+            )]
+
+    def close(self):
+        self.db.close()
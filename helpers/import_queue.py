@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+from time import time
+
+import sqlite3
+
+class ImportQueue(object):
+    """
+    IDs waiting to be imported, stored in an SQLite database along with
+    the number of failed attempts to import them. A queue may be shared
+    by threads.
+
+    An ID whose import failed is retried after retry_delay seconds, the
+    delay doubling with every further attempt. After max_attempts failed
+    attempts, the last of which it was imported on its own, it is kept as
+    failed and no longer returned.
+    """
+    def __init__(self, filename, max_attempts, retry_delay):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS queue (id TEXT PRIMARY KEY, ' +
+            'attempts INTEGER, due REAL, error TEXT)'
+        )
+        self.db.commit()
+
+    def add(self, ids):
+        """
+        Adds IDs to the queue, unless they are queued already.
+        """
+        now = time()
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO queue VALUES (?, 0, ?, NULL)',
+                [(id, now) for id in ids]
+            )
+            self.db.commit()
+
+    def take(self, size):
+        """
+        Returns up to size IDs that are due. An ID that failed before is
+        returned on its own, so that it cannot make other IDs fail.
+        """
+        now = time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT id FROM queue WHERE attempts > 0 AND due <= ? ' +
+                'ORDER BY due LIMIT 1', (now,)
+            ).fetchone()
+            if row is not None:
+                return [row[0]]
+            return [row[0] for row in self.db.execute(
+                'SELECT id FROM queue WHERE attempts = 0 AND due <= ? ' +
+                'ORDER BY rowid LIMIT ?', (now, size)
+            )]
+
+    def get_next_due(self):
+        """
+        Returns the time the next ID is due, or None if no ID is left.
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT MIN(due) FROM queue WHERE due IS NOT NULL'
+            ).fetchone()[0]
+
+    def done(self, ids):
+        with self.lock:
+            self.db.executemany(
+                'DELETE FROM queue WHERE id = ?', [(id,) for id in ids]
+            )
+            self.db.commit()
+
+    def fail(self, ids, error):
+        """
+        Records a failed attempt to import IDs, returning those that are
+        no longer retried.
+        """
+        now = time()
+        failed = []
+        with self.lock:
+            for id in ids:
+                attempts = self.db.execute(
+                    'SELECT attempts FROM queue WHERE id = ?', (id,)
+                ).fetchone()[0] + 1
+                due = None
+                # only give up on IDs that failed on their own
+                if attempts < self.max_attempts or len(ids) > 1:
+                    due = now + self.retry_delay * 2 ** (attempts - 1)
+                else:
+                    failed.append(id)
+                self.db.execute(
+                    'UPDATE queue SET attempts = ?, due = ?, error = ? ' +
+                    'WHERE id = ?', (attempts, due, error, id)
+                )
+            self.db.commit()
+        return failed
+
+    def get_failed(self):
+        """
+        Returns IDs that are no longer retried, along with their error.
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT id, error FROM queue WHERE due IS NULL ORDER BY id'
+            ).fetchall()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+from time import time
+
+import sqlite3
+
+IMPORTED = 'imported'
+FAILED = 'failed'
+
+class Ledger(object):
+    """
+    IDs that were processed, stored in an SQLite database along with the
+    outcome and time of processing, and high-water marks, e.g. the date
+    up to which IDs were listed completely. A ledger may be shared by
+    threads.
+    """
+    def __init__(self, filename):
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS ledger (id TEXT PRIMARY KEY, ' +
+            'outcome TEXT, processed REAL)'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, ' +
+            'value TEXT)'
+        )
+        self.db.commit()
+
+    def record(self, ids, outcome):
+        """
+        Records the outcome of processing IDs, replacing earlier ones.
+        """
+        now = time()
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO ledger VALUES (?, ?, ?)',
+                [(id, outcome, now) for id in ids]
+            )
+            self.db.commit()
+
+    def get_imported(self, ids):
+        """
+        Returns the set of given IDs that were imported successfully.
+        """
+        imported = set()
+        with self.lock:
+            for id in ids:
+                row = self.db.execute(
+                    'SELECT outcome FROM ledger WHERE id = ?', (id,)
+                ).fetchone()
+                if row is not None and row[0] == IMPORTED:
+                    imported.add(id)
+        return imported
+
+    def get_watermark(self, name):
+        """
+        Returns the value of a high-water mark, or None if it is not set.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM watermarks WHERE name = ?', (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_watermark(self, name, value):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO watermarks VALUES (?, ?)',
+                (name, value)
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -8,6 +8,9 @@ is_uploaded_cache = SimpleCache()
 
 wiki = wikitools.wiki.Wiki(config.api_url)
 
+# raised by upload if the wiki or the network fails
+UPLOAD_ERRORS = (wikitools.api.APIError, wikitools.wiki.WikiError, IOError)
+
 def query(params):
     request = wikitools.api.APIRequest(wiki, params)
     try:
@@ -103,15 +106,26 @@ def is_uploaded(material):
     return False  # Caveat: This might be wrong if redirects do not
                   # show up in search results.
 
+# whether wiki holds a login, so that a process logs in only once
+_logged_in = False
+
 def upload(filename, wiki_filename, page_template):
     """
-    Uploades a file to a mediawiki site.
+    Uploades a file to a mediawiki site, logging in before the first
+    upload and again after an upload failed.
     """
-    stderr.write('Authenticating with <%s>.\n' % config.api_url)
-    wiki.login(username=config.username, password=config.password)
+    global _logged_in
+    if not _logged_in:
+        stderr.write('Authenticating with <%s>.\n' % config.api_url)
+        wiki.login(username=config.username, password=config.password)
+        _logged_in = True
     wiki_file = wikitools.wikifile.File(wiki=wiki, title=wiki_filename)
-    wiki_file.upload(
-        fileobj = open(filename, 'r'),
-        text=page_template.encode('utf-8'),
-        comment = 'Automatically uploaded media file from [[:en:Open access|Open Access]] source. Please report problems or suggestions [[User talk:Open Access Media Importer Bot|here]].'
-    )
+    try:
+        wiki_file.upload(
+            fileobj = open(filename, 'r'),
+            text=page_template.encode('utf-8'),
+            comment = 'Automatically uploaded media file from [[:en:Open access|Open Access]] source. Please report problems or suggestions [[User talk:Open Access Media Importer Bot|here]].'
+        )
+    except UPLOAD_ERRORS:
+        _logged_in = False  # the session may have expired
+        raise
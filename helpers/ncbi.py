@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from httplib import HTTPException
+from multiprocessing.pool import ThreadPool
+from os import rename
+from threading import Lock
+from time import sleep
+from urllib2 import urlopen, quote, Request, HTTPError, URLError
+
+import random
+import socket
+
+import config
+from token_bucket import TokenBucket
+
+# Requests per second NCBI allows without and with an API key, see
+# <https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Usage_Guidelines_and_Requiremen>
+RATE = 3
+RATE_WITH_API_KEY = 10
+
+BUFSIZE = 1024000  # (1024KB)
+RETRIES = 8
+BACKOFF = 1  # seconds before first retry, doubled for every further one
+MAX_BACKOFF = 120
+TIMEOUT = 60
+USER_AGENT = 'oa-get/2012-07-21'
+
+def _is_transient(error):
+    """
+    Returns whether a request that failed with an error may succeed if
+    it is sent again.
+    """
+    if isinstance(error, HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (URLError, HTTPException, socket.error))
+
+def _get_retry_after(error):
+    # hdrs, unlike headers, is also set on errors without a body
+    try:
+        return float(error.hdrs['Retry-After'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return 0
+
+class Scheduler(object):
+    """
+    Sends requests to NCBI servers within their per-second budget, up to
+    concurrency requests at a time. A request failing with an error that
+    may be transient is retried after a randomised, exponentially growing
+    delay; if it still fails after RETRIES retries, the error is raised.
+
+    If an API key is given, it is added to E-utilities requests and the
+    higher request budget that comes with it is used.
+    """
+    def __init__(self, api_key=None, concurrency=None):
+        self.api_key = api_key
+        rate = RATE
+        if api_key is not None:
+            rate = RATE_WITH_API_KEY
+        self.bucket = TokenBucket(rate, 1)  # requests are spaced evenly
+        self.concurrency = concurrency or rate
+
+    def _prepare_url(self, url):
+        if self.api_key is not None and '/entrez/eutils/' in url:
+            separator = '?'
+            if separator in url:
+                separator = '&'
+            url += separator + 'api_key=' + quote(self.api_key)
+        return url
+
+    def open(self, url, data=None, user_agent=USER_AGENT, on_error=None):
+        """
+        Returns the response to a request as a file-like object. Only
+        establishing the connection is retried; on_error is called with
+        every error that leads to a retry.
+        """
+        return self._retry(self._open, url, data, user_agent, on_error)
+
+    def fetch(self, url, data=None, user_agent=USER_AGENT, on_error=None):
+        """
+        Returns the body of the response to a request, retrying the whole
+        request if reading the body fails, too.
+        """
+        def _fetch(url, data, user_agent):
+            response = self._open(url, data, user_agent)
+            try:
+                return response.read()
+            finally:
+                response.close()
+        return self._retry(_fetch, url, data, user_agent, on_error)
+
+    def fetch_to_file(self, url, filename, data=None, user_agent=USER_AGENT,
+        on_error=None):
+        """
+        Streams the body of the response to a request into a partial file
+        that is renamed to filename once complete, retrying the whole
+        request if reading the body fails.
+        """
+        def _fetch_to_file(url, data, user_agent):
+            response = self._open(url, data, user_agent)
+            try:
+                with open(filename + '.part', 'wb') as part_file:
+                    for chunk in iter(lambda: response.read(BUFSIZE), ''):
+                        part_file.write(chunk)
+            finally:
+                response.close()
+            rename(filename + '.part', filename)
+        self._retry(_fetch_to_file, url, data, user_agent, on_error)
+
+    def fetch_all(self, urls, user_agent=USER_AGENT):
+        """
+        Fetches URLs concurrently, yielding the bodies of the responses in
+        the order of the URLs.
+        """
+        pool = ThreadPool(self.concurrency)
+        try:
+            for body in pool.imap(lambda url: self.fetch(url, None, user_agent), urls):
+                yield body
+        finally:
+            pool.terminate()
+
+    def _open(self, url, data, user_agent):
+        request = Request(self._prepare_url(url), data, {'User-Agent': user_agent})
+        self.bucket.take()
+        return urlopen(request, timeout=TIMEOUT)
+
+    def _retry(self, function, url, data, user_agent, on_error):
+        attempt = 0
+        while True:
+            try:
+                return function(url, data, user_agent)
+            except Exception, e:
+                if attempt >= RETRIES or not _is_transient(e):
+                    raise
+                if on_error is not None:
+                    on_error(e)
+                # “full jitter” keeps retrying clients from synchronising
+                delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+                sleep(max(delay, _get_retry_after(e)))
+                attempt += 1
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+def get_scheduler():
+    """
+    Returns the scheduler shared by all NCBI requests of this process.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(config.ncbi_api_key)
+    return _scheduler
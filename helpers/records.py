@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import marshal
+import sqlite3
+import zlib
+
+# Number of stored records after which they are committed.
+COMMIT_INTERVAL = 1000
+
+def _connect(filename, version, table, columns):
+    """
+    Opens an SQLite database holding a table with the given columns,
+    emptying the table if it was written with another version.
+    """
+    db = sqlite3.connect(filename)
+    db.text_factory = str
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (table, columns))
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+    )
+    row = db.execute(
+        'SELECT value FROM meta WHERE key = ?', ('version',)
+    ).fetchone()
+    stored_version = None if row is None else row[0]
+    if stored_version != version:
+        db.execute('DELETE FROM %s' % table)
+        db.execute(
+            'INSERT OR REPLACE INTO meta VALUES (?, ?)', ('version', version)
+        )
+        db.commit()
+    return db
+
+class RecordStore(object):
+    """
+    Article information extracted from metadata files, stored in an
+    SQLite database so that it can be listed again without parsing XML.
+
+    Records are stored by archive and member name along with the
+    modification time of the member and are only returned for the same
+    modification time. A record of None marks an article that yielded
+    nothing, e.g. because it has no media.
+
+    Records are only valid for the code that extracted them; if the
+    store was written with another version (see record_version in the
+    sources), all records are removed when it is opened.
+    """
+    def __init__(self, filename, version=None):
+        self.db = _connect(filename, version, 'records',
+            'archive TEXT, member TEXT, mtime INTEGER, record BLOB, ' +
+            'PRIMARY KEY (archive, member)')
+        self.uncommitted = 0
+
+    def get(self, archive, member, mtime):
+        """
+        Returns the record stored for a member of an archive, raising
+        KeyError if there is none or it belongs to another version.
+        """
+        row = self.db.execute(
+            'SELECT record FROM records ' +
+            'WHERE archive = ? AND member = ? AND mtime = ?',
+            (archive, member, mtime)
+        ).fetchone()
+        if row is None:
+            raise KeyError, (archive, member)
+        return marshal.loads(zlib.decompress(row[0]))
+
+    def put(self, archive, member, mtime, record):
+        self.db.execute(
+            'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)',
+            (archive, member, mtime,
+                sqlite3.Binary(zlib.compress(marshal.dumps(record))))
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+class NoMediaStore(object):
+    """
+    Names of articles that were found to have no media, stored in an
+    SQLite database along with the modification time of their files so
+    that later runs need not read them again, even without a record
+    store. Like records, names are dropped when the store is opened with
+    another version.
+    """
+    def __init__(self, filename, version=None):
+        self.db = _connect(filename, version, 'no_media',
+            'member TEXT PRIMARY KEY, mtime INTEGER')
+        self.uncommitted = 0
+
+    def get(self, member):
+        """
+        Returns the modification time a member was found to have no
+        media at, or None if it was not.
+        """
+        row = self.db.execute(
+            'SELECT mtime FROM no_media WHERE member = ?', (member,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def put(self, member, mtime):
+        self.db.execute(
+            'INSERT OR REPLACE INTO no_media VALUES (?, ?)', (member, mtime)
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
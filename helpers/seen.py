@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from hashlib import md5
+from math import ceil, log
+from mmap import mmap
+from os import path, remove
+
+import sqlite3
+import struct
+
+def _encode(name):
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+def _decode(name):
+    if isinstance(name, str):
+        return name.decode('utf-8')
+    return name
+
+class BloomFilter(object):
+    """
+    Bloom filter stored in a memory-mapped file.
+    """
+    def __init__(self, filename, capacity, error_rate=0.001):
+        # optimal number of bits and hash functions, explained at
+        # <http://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions>
+        self.bits = int(ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) * log(2))))
+        with open(filename, 'wb') as f:
+            f.truncate((self.bits + 7) // 8)
+        self.file = open(filename, 'r+b')
+        self.map = mmap(self.file.fileno(), 0)
+
+    def _positions(self, name):
+        # double hashing as described by Kirsch and Mitzenmacher in
+        # <http://www.eecs.harvard.edu/~kirsch/pubs/bbbf/esa06.pdf>
+        a, b = struct.unpack('<QQ', md5(_encode(name)).digest())
+        return [(a + i * b) % self.bits for i in xrange(self.hashes)]
+
+    def add(self, name):
+        for position in self._positions(name):
+            byte = position >> 3
+            self.map[byte] = chr(ord(self.map[byte]) | 1 << (position & 7))
+
+    def __contains__(self, name):
+        for position in self._positions(name):
+            if not ord(self.map[position >> 3]) & 1 << (position & 7):
+                return False
+        return True
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+class DiskSeenSet(object):
+    """
+    Set of names kept on disk, for runs where a set in memory would be
+    too large. Most lookups are answered by a Bloom filter; the rest are
+    decided by an exact index in an SQLite database.
+    """
+    def __init__(self, filename, capacity):
+        for p in (filename + '.bloom', filename + '.sqlite'):
+            if path.exists(p):
+                remove(p)
+        self.bloom = BloomFilter(filename + '.bloom', capacity)
+        self.index = sqlite3.connect(filename + '.sqlite')
+        self.index.execute('PRAGMA synchronous = OFF')
+        self.index.execute('PRAGMA journal_mode = OFF')
+        self.index.execute('CREATE TABLE seen (name TEXT PRIMARY KEY)')
+        self.length = 0
+
+    def add(self, name):
+        self.bloom.add(name)
+        cursor = self.index.execute(
+            'INSERT OR IGNORE INTO seen VALUES (?)', (_decode(name),)
+        )
+        self.length += cursor.rowcount
+
+    def update(self, names):
+        def _add_to_bloom(names):
+            for name in names:
+                self.bloom.add(name)
+                yield (_decode(name),)
+        cursor = self.index.executemany(
+            'INSERT OR IGNORE INTO seen VALUES (?)', _add_to_bloom(names)
+        )
+        self.length += cursor.rowcount
+
+    def __contains__(self, name):
+        if name not in self.bloom:
+            return False
+        cursor = self.index.execute(
+            'SELECT 1 FROM seen WHERE name = ?', (_decode(name),)
+        )
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        return self.length
+
+    def close(self):
+        self.bloom.close()
+        self.index.close()
+
+def seen_set(names, filename=None, capacity=None):
+    """
+    Returns a set of names that sources use to skip articles: a set in
+    memory or, if filename is given, a DiskSeenSet stored there.
+    """
+    if filename is None:
+        return set(names)
+    seen = DiskSeenSet(filename, capacity)
+    seen.update(names)
+    return seen
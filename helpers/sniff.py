@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from threading import Lock, local
+from time import time
+
+import magic
+import sqlite3
+
+from autovividict import autovividict
+
+# Bytes read to detect a MIME type, until it is detected completely. 12
+# bytes should be enough to detect audio or video resources
+# <http://mimesniff.spec.whatwg.org/#matching-an-audio-or-video-type-pattern>,
+# partial MS Office documents are detected as corrupt.
+SIZES = [12, 4096, 65536]
+
+# Seconds a cached MIME type is used without asking the server whether
+# the file changed.
+TTL = 30 * 24 * 60 * 60
+
+# Counters of MIME type checks, e.g. statistics['sniff']['cached'].
+statistics = autovividict()
+_statistics_lock = Lock()
+
+def _count(group, name, count=1):
+    with _statistics_lock:
+        statistics[group][name] += count
+
+def _is_incomplete(mimetype):
+    return 'Document, corrupt' in mimetype  # partial MS Office document
+
+def _guess_office_mimetype(url, mimetype):
+    if _is_incomplete(mimetype):  # larger than the largest range read
+        mimetype = 'application/msword'
+    if mimetype == 'application/msword':
+        # MS Office documents are all detected as application/msword, therefore guess based on extension
+        # <http://www.mediawiki.org/wiki/Manual_talk:Mime_type_detection#Fix_for_MS_Office_File_Confusion>
+        if url.endswith('ppt') or url.endswith('PPT'):
+            mimetype = 'application/vnd.ms-powerpoint'
+        elif url.endswith('xls') or url.endswith('XLS'):
+            mimetype = 'application/vnd.ms-excel'
+    return mimetype
+
+class SniffCache(object):
+    """
+    Detected MIME types, stored in an SQLite database by URL along with
+    the ETag or Last-Modified header of the response, which is used to
+    ask the server whether the file changed. A cache may be shared by
+    threads.
+    """
+    def __init__(self, filename):
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS sniffs (url TEXT PRIMARY KEY, ' +
+            'mimetype TEXT, etag TEXT, last_modified TEXT, checked REAL)'
+        )
+        self.db.commit()
+
+    def get(self, url):
+        """
+        Returns MIME type, ETag, Last-Modified header and time of the last
+        check for a URL, or None if it was not checked.
+        """
+        with self.lock:
+            return self.db.execute(
+                'SELECT mimetype, etag, last_modified, checked FROM sniffs ' +
+                'WHERE url = ?', (url,)
+            ).fetchone()
+
+    def put(self, url, mimetype, etag, last_modified):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO sniffs VALUES (?, ?, ?, ?, ?)',
+                (url, mimetype, etag, last_modified, time())
+            )
+            self.db.commit()
+
+    def touch(self, url):
+        with self.lock:
+            self.db.execute(
+                'UPDATE sniffs SET checked = ? WHERE url = ?', (time(), url)
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+class Sniffer(object):
+    """
+    Detects MIME types from the first bytes of files. These are read from
+    a local copy if there is one, or else requested over a connection
+    pool in ranges that grow until the MIME type is detected or max_size
+    bytes were read. Results are cached. A sniffer may be shared by
+    threads; every thread gets its own libmagic handle.
+    """
+    def __init__(self, connections, cache, max_size):
+        self.connections = connections
+        self.cache = cache
+        self.sizes = [size for size in SIZES if size < max_size] + [max_size]
+        self.local = local()
+
+    def _detect(self, chunk):
+        if not hasattr(self.local, 'magic'):
+            self.local.magic = magic.open(magic.MIME_TYPE)
+            self.local.magic.load()
+        return self.local.magic.buffer(chunk)
+
+    def sniff(self, url, local_filename=None):
+        """
+        Returns the MIME type of the file at url, as detected by libmagic.
+        """
+        if local_filename is not None and path.exists(local_filename):
+            chunk = ''
+            with open(local_filename, 'rb') as local_file:
+                for size in self.sizes:
+                    chunk += local_file.read(size - len(chunk))
+                    mimetype = self._detect(chunk)
+                    if not _is_incomplete(mimetype) or len(chunk) < size:
+                        break
+            _count('sniff', 'local')
+            return _guess_office_mimetype(url, mimetype)
+
+        headers = {}
+        cached = self.cache.get(url)
+        if cached is not None:
+            cached_mimetype, etag, last_modified, checked = cached
+            if time() - checked < TTL:
+                _count('sniff', 'cached')
+                return cached_mimetype
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            elif last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        chunk = ''
+        for size in self.sizes:
+            headers['Range'] = 'bytes=%s-%s' % (len(chunk), size - 1)
+            response = self.connections.open(url, headers)
+            try:
+                if response.status == 304:  # Not Modified
+                    self.cache.touch(url)
+                    _count('sniff', 'revalidated')
+                    return cached_mimetype
+                if response.status == 206:  # Partial Content
+                    chunk += response.read(size - len(chunk))
+                else:  # server ignored the range
+                    chunk = response.read(size)
+                etag = response.headers.getheader('etag')
+                last_modified = response.headers.getheader('last-modified')
+            finally:
+                response.close()
+            headers = {}
+            mimetype = self._detect(chunk)
+            if not _is_incomplete(mimetype) or len(chunk) < size:
+                break
+        _count('sniff', 'requested')
+        _count('sniff-bytes', 'requested', len(chunk))
+        mimetype = _guess_office_mimetype(url, mimetype)
+        self.cache.put(url, mimetype, etag, last_modified)
+        return mimetype
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+from time import sleep, time
+
+class TokenBucket(object):
+    """
+    Token bucket holding up to capacity tokens, by default as many as
+    are added in one second, refilled at rate tokens per second. Taking
+    tokens waits until they are due, so that threads sharing a bucket
+    together stay within the rate. A rate of 0 means no limit.
+
+    helpers.ncbi takes a token per request, helpers.download one per
+    byte read.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time()
+        self.lock = Lock()
+
+    def take(self, amount=1):
+        """
+        Takes amount tokens from the bucket, waiting until they are due.
+        Tokens may be taken beyond those in the bucket; later takers
+        then wait for them, too.
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            now = time()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / float(self.rate)
+        if wait > 0:
+            sleep(wait)
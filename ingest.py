@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import class_mapper
+from sys import stderr
+
+from helpers import config
+from model import session, Article, Category, Journal, SupplementaryMaterial
+
+def _get_foreign_key(pairs, values):
+    """
+    Given pairs of foreign key column and referenced column, and values
+    by name of the referenced columns, returns values by name of the
+    foreign key columns.
+    """
+    return dict((column.name, values[other.name]) for column, other in pairs)
+
+class OrmIngest(object):
+    """
+    Adds article information to the database with the Elixir entities,
+    querying for every journal, article, category and supplementary
+    material and committing after every article with media.
+    """
+    def add(self, result):
+        """
+        Adds article information as yielded by sources to the database,
+        returning False if the article was skipped.
+        """
+        journal = Journal.get_by(title=result['journal-title'])
+        if not journal:
+            journal = Journal(
+                title = result['journal-title']
+            )
+        article = Article.get_by(
+            title=result['article-title'],
+            contrib_authors=result['article-contrib-authors']
+        )
+        if not article:
+            # if there is a whitelist, skip non-whitelisted content
+            doi = result['doi']
+            try:
+                doi_prefix = doi.split('/')[0]
+            except AttributeError:
+                stderr.write(
+                    "Skipping Article “%s”, as it has no DOI.\n" % \
+                        result['name']
+                )
+                return False
+            if config.whitelist_doi and \
+                doi_prefix not in config.whitelist_doi:
+                stderr.write(
+                    "Skipping DOI %s, prefix %s is not in whitelist.\n" % \
+                        (doi, doi_prefix)
+                    )
+                return False
+            article = Article(
+                name=result['name'],
+                doi=doi,
+                title=result['article-title'],
+                contrib_authors=result['article-contrib-authors'],
+                abstract=result['article-abstract'],
+                year=result['article-year'],
+                month=result['article-month'],
+                day=result['article-day'],
+                url=result['article-url'],
+                license_url=result['article-license-url'],
+                license_text=result['article-license-text'],
+                copyright_statement=result['article-copyright-statement'],
+                copyright_holder=result['article-copyright-holder'],
+                journal=journal
+            )
+        for category_name in result['article-categories']:
+            category = Category.get_by(name=category_name)
+            if not category:
+                category = Category(name=category_name)
+            category.articles.append(article)
+        for material in result['supplementary-materials']:
+            supplementary_material = SupplementaryMaterial.get_by(url=material['url'])
+            if not supplementary_material:
+                supplementary_material=SupplementaryMaterial(
+                    label=material['label'],
+                    title=material['title'],
+                    caption=material['caption'],
+                    mimetype=material['mimetype'],
+                    mime_subtype=material['mime-subtype'],
+                    url=material['url'],
+                    article=article
+                )
+        if result['supplementary-materials']:
+            session.commit()
+        return True
+
+    def flush(self):
+        session.commit()
+
+class BulkIngest(object):
+    """
+    Adds article information to the database in batches of INSERT
+    statements, instead of querying for every journal, article, category
+    and supplementary material the way the Elixir entities do.
+
+    Titles of journals and names of categories in the database are kept
+    in memory. Rows are inserted, ignoring rows that exist already, and
+    committed every commit_interval articles. The resulting database is
+    the same as after adding articles with OrmIngest.
+    """
+    def __init__(self, commit_interval):
+        self.commit_interval = commit_interval
+        self.journals = set(
+            row[0] for row in session.execute(select([Journal.table.c.title]))
+        )
+        self.categories = set(
+            row[0] for row in session.execute(select([Category.table.c.name]))
+        )
+        self.articles = set()  # keys of articles inserted since last flush
+        # columns referring to other tables, as named by Elixir
+        self.article_journal = \
+            class_mapper(Article).get_property('journal').local_remote_pairs
+        self.material_article = class_mapper(SupplementaryMaterial). \
+            get_property('article').local_remote_pairs
+        category_articles = class_mapper(Category).get_property('articles')
+        self.category_links = category_articles.secondary
+        self.link_category = [(link, category) for category, link in \
+            category_articles.synchronize_pairs]
+        self.link_article = [(link, article) for article, link in \
+            category_articles.secondary_synchronize_pairs]
+        # in order of foreign keys
+        self.tables = [
+            Journal.table,
+            Category.table,
+            Article.table,
+            self.category_links,
+            SupplementaryMaterial.table
+        ]
+        self.rows = dict((table, []) for table in self.tables)
+        self.pending = 0
+
+    def _article_exists(self, title, contrib_authors):
+        if (title, contrib_authors) in self.articles:
+            return True
+        table = Article.table
+        return session.execute(
+            select([table.c.title]).where(and_(
+                table.c.title == title,
+                table.c.contrib_authors == contrib_authors
+            ))
+        ).first() is not None
+
+    def add(self, result):
+        """
+        Adds article information as yielded by sources to the database,
+        returning False if the article was skipped.
+        """
+        journal_title = result['journal-title']
+        if journal_title not in self.journals:
+            self.journals.add(journal_title)
+            self.rows[Journal.table].append({'title': journal_title})
+
+        article_key = {
+            'title': result['article-title'],
+            'contrib_authors': result['article-contrib-authors']
+        }
+        # if there is a whitelist, skip non-whitelisted content, unless
+        # the article exists; only then it is looked up in the database,
+        # rows of other articles are inserted unless they exist already
+        doi = result['doi']
+        skip_message = None
+        try:
+            doi_prefix = doi.split('/')[0]
+            if config.whitelist_doi and \
+                doi_prefix not in config.whitelist_doi:
+                skip_message = \
+                    "Skipping DOI %s, prefix %s is not in whitelist.\n" % \
+                        (doi, doi_prefix)
+        except AttributeError:
+            skip_message = "Skipping Article “%s”, as it has no DOI.\n" % \
+                result['name']
+        if skip_message is not None:
+            if not self._article_exists(**article_key):
+                stderr.write(skip_message)
+                return False
+        elif (article_key['title'], article_key['contrib_authors']) not in \
+            self.articles:
+            article = {
+                'name': result['name'],
+                'doi': doi,
+                'abstract': result['article-abstract'],
+                'year': result['article-year'],
+                'month': result['article-month'],
+                'day': result['article-day'],
+                'url': result['article-url'],
+                'license_url': result['article-license-url'],
+                'license_text': result['article-license-text'],
+                'copyright_statement': result['article-copyright-statement'],
+                'copyright_holder': result['article-copyright-holder']
+            }
+            article.update(article_key)
+            article.update(_get_foreign_key(
+                self.article_journal,
+                {'title': journal_title}
+            ))
+            self.rows[Article.table].append(article)
+            self.articles.add((article_key['title'], article_key['contrib_authors']))
+
+        for category_name in result['article-categories']:
+            if category_name not in self.categories:
+                self.categories.add(category_name)
+                self.rows[Category.table].append({'name': category_name})
+            link = _get_foreign_key(self.link_category, {'name': category_name})
+            link.update(_get_foreign_key(self.link_article, article_key))
+            self.rows[self.category_links].append(link)
+
+        for material in result['supplementary-materials']:
+            supplementary_material = {
+                'label': material['label'],
+                'title': material['title'],
+                'caption': material['caption'],
+                'mimetype': material['mimetype'],
+                'mime_subtype': material['mime-subtype'],
+                'url': material['url']
+            }
+            supplementary_material.update(_get_foreign_key(
+                self.material_article,
+                article_key
+            ))
+            self.rows[SupplementaryMaterial.table].append(supplementary_material)
+
+        self.pending += 1
+        if self.pending >= self.commit_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Inserts and commits all pending rows.
+        """
+        for table in self.tables:
+            rows = self.rows[table]
+            if rows:
+                # SQLite: INSERT OR IGNORE skips rows with existing keys
+                session.execute(table.insert(prefixes=['OR IGNORE']), rows)
+                self.rows[table] = []
+        session.commit()
+        self.articles.clear()
+        self.pending = 0
@@ -3,11 +3,52 @@
 
 from elixir import *
 from os import path
+from sqlalchemy import create_engine
+
+import elixir
 
 from helpers import config
 
 def set_source(source):
-    metadata.bind = 'sqlite:///%s' % config.database_path(source)
+    # several processes may work on the database of a source at once,
+    # waiting for each other's writes
+    metadata.bind = create_engine(
+        'sqlite:///%s' % config.database_path(source),
+        connect_args={'timeout': 60}
+    )
+
+def setup_all(create_tables=False, *args, **kwargs):
+    """
+    Sets up all entities like elixir.setup_all and, if tables are created,
+    adds columns missing from tables that an earlier version created.
+    """
+    elixir.setup_all(create_tables, *args, **kwargs)
+    if create_tables:
+        _add_missing_columns()
+
+def _add_missing_columns():
+    connection = metadata.bind.connect()
+    try:
+        for table in metadata.sorted_tables:
+            existing_columns = set(
+                row[1] for row in
+                    connection.execute('PRAGMA table_info(%s)' % table.name)
+            )
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                definition = '%s %s' % (
+                    column.name,
+                    column.type.compile(metadata.bind.dialect)
+                )
+                # rows that exist already get the default of flags
+                if column.default is not None and column.default.is_scalar \
+                    and isinstance(column.default.arg, (bool, int)):
+                    definition += ' DEFAULT %d' % column.default.arg
+                connection.execute('ALTER TABLE %s ADD COLUMN %s' % \
+                    (table.name, definition))
+    finally:
+        connection.close()
 
 class Journal(Entity):
     title = Field(UnicodeText, primary_key=True)
@@ -31,6 +72,10 @@ class Article(Entity):
     license_text = Field(UnicodeText)
     copyright_statement = Field(UnicodeText)
     copyright_holder = Field(UnicodeText)
+    pmid = Field(Integer)  # or None
+    pmcid = Field(Integer)  # or None
+    ids_resolved = Field(Boolean, default=False)  # pmid and pmcid looked up
+    mesh_fetched = Field(Boolean, default=False)  # MeshCategory rows stored
     journal = ManyToOne('Journal')
     supplementary_materials = OneToMany('SupplementaryMaterial')
     categories = ManyToMany('Category')
@@ -38,6 +83,12 @@ class Article(Entity):
     def __repr__(self):
         return '<Article "%s">' % self.title.encode('utf-8')
 
+# MeSH headings of PubMed articles, used as categories on upload
+class MeshCategory(Entity):
+    pmid = Field(Integer, primary_key=True)
+    position = Field(Integer, primary_key=True)  # order of headings
+    name = Field(UnicodeText)
+
 class SupplementaryMaterial(Entity):
     label = Field(UnicodeText)
     title = Field(UnicodeText)
@@ -46,13 +97,31 @@ class SupplementaryMaterial(Entity):
     mime_subtype = Field(UnicodeText)
     mimetype_reported = Field(UnicodeText)
     mime_subtype_reported = Field(UnicodeText)
+    mimetype_classified = Field(Boolean, default=False)  # not checked, see helpers.classify
     url = Field(UnicodeText, primary_key=True)
     article = ManyToOne('Article')
     downloaded = Field(Boolean, default=False)
+    download_error = Field(UnicodeText)  # or None, of the last attempt to download
+    size = Field(Integer)  # of the downloaded file in bytes
+    sha256 = Field(UnicodeText)  # hex digest of the downloaded file
+    duplicate_of = Field(UnicodeText)  # URL the same file was first downloaded from, see helpers.blobs
     converting = Field(Boolean, default=False)
     converted = Field(Boolean, default=False)
     uploaded = Field(Boolean, default=False)
+    upload_error = Field(UnicodeText)  # or None, of the last attempt to upload
 
     def __repr__(self):
         return '<SupplementaryMaterial “%s” of Article “%s”>' % \
             (self.label.encode('utf-8'), self.article.title.encode('utf-8'))
+
+def get_materials(names=None, **kwargs):
+    """
+    Returns supplementary materials with the given column values, only
+    those of articles with the given names if names are given.
+    """
+    query = SupplementaryMaterial.query.filter_by(**kwargs)
+    if names:
+        query = query.filter(
+            SupplementaryMaterial.article.has(Article.name.in_(names))
+        )
+    return query.all()
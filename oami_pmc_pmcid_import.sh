@@ -1,10 +1,9 @@
 #!/bin/bash
 
-TIMEOUTFILE=timeout_pmcid.txt
 SCRIPTNAME=`basename $0`
 PIDFILE=/var/lock/${SCRIPTNAME}.pid
 
-trap "killall oami_pmc_pmcid_import oa-put oa-get oa-cache; echo 'signal caught, exiting'; exit 255" SIGINT SIGTERM
+trap "killall oami_pmc_pmcid_daemon oami_pmc_pmcid_import oa-put oa-get oa-cache; echo 'signal caught, exiting'; exit 255" SIGINT SIGTERM
 
 # from http://stackoverflow.com/a/959511
 if [[ -f ${PIDFILE} ]]; then
@@ -34,7 +33,7 @@ echo ${PID} > ${PIDFILE}
 
 # make sure that all previous processes are gone
 
-killall oami_pmc_pmcid_import
+killall oami_pmc_pmcid_daemon oami_pmc_pmcid_import
 sleep 1
 killall oa-put oa-cache oa-get
 
@@ -44,18 +43,10 @@ if [[ -n ${STILL_RUNNING} ]]; then
    exit 255
 fi
 
-# clear cache
-./oa-cache clear-database pmc_pmcid
-
-for pmcid in $(./oa-pmc-ids --from $(date +"%F" -d '3 days ago') --until $(date +"%F")); do
-  date
-  timeout 6h sh -c "echo $pmcid | ./oami_pmc_pmcid_import"
-  if [ $? -eq 124 ]; then 
-        echo "------------------ Timed out! --------------------"
-        echo $pmcid >> "$TIMEOUTFILE"
-  fi
-  ./oa-cache clear-database pmc_pmcid 
-done;
+# import articles updated since the last run in batches; failed PMCIDs
+# are retried with growing delays
+./oa-pmc-ids --incremental --from $(date +"%F" -d '3 days ago') --until $(date +"%F") | \
+  ./oami_pmc_pmcid_daemon
 
 if [ -f ${PIDFILE} ]; then
     rm ${PIDFILE}
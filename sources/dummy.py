@@ -18,7 +18,9 @@ def download_metadata(target_directory):
             }
             sleep(0.5)
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+def list_articles(target_directory, supplementary_materials=False, skip=None):
+    if skip is None:
+        skip = set()
     for fake_media in [
         {
             'name': "Parasit_Vectors/Parasit_Vectors_2008_Sep_1_1_29.nxml".decode('utf-8'),
@@ -44,4 +46,7 @@ def list_articles(target_directory, supplementary_materials=False, skip=[]):
             ]
         }
     ]:
+        if fake_media['name'] in skip:
+            continue
+        skip.add(fake_media['name'])
         yield fake_media
@@ -54,7 +54,9 @@ def download_metadata(target_directory):
         writer.writerow(result)
     yield { 'url': url, 'completed': 1, 'total': 1 }
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+def list_articles(target_directory, supplementary_materials=False, skip=None):
+    if skip is None:
+        skip = set()
     with open(path.join(target_directory, 'metadata.csv')) as f:
         reader = csv.DictReader(
             f,
@@ -77,8 +79,12 @@ def list_articles(target_directory, supplementary_materials=False, skip=[]):
             quoting=csv.QUOTE_ALL
         )
         for row in reader:
+            name = row['name'].decode('utf-8')
+            if name in skip:
+                continue
+            skip.add(name)
             result = {}
-            result['name'] = row['name'].decode('utf-8')
+            result['name'] = name
             result['article-contrib-authors'] = row['article-contrib-authors'].decode('utf-8')
             result['article-title'] = row['article-title'].decode('utf-8')
             result['article-abstract'] = row['article-abstract'].decode('utf-8')
@@ -1,101 +1,794 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from bisect import bisect_right
+from cStringIO import StringIO
 from datetime import date
-from os import listdir, path
+from hashlib import md5
+from multiprocessing import Process, Queue
+from os import listdir, path, rename
+from Queue import Empty, Full
 from sys import stderr
-from urllib2 import urlopen, urlparse
-from xml.etree.cElementTree import dump, ElementTree
+from time import sleep
+from urllib2 import urlparse
+from xml.etree.cElementTree import dump, ElementTree, iterparse
 # the C implementation of ElementTree is 5 to 20 times faster than the Python one
 
-from hashlib import md5
-
+import gzip
+import re
+import signal
 import tarfile
 import logging
+import traceback
+import zlib
+
+from helpers import autovividict, config, download
+
+# Number of compressed bytes decompressed at once when reading archives.
+BUFSIZE = 65536
+
+# Number of uncompressed bytes between restart points of indexed archives,
+# and the compression level they are written with.
+MEMBER_SIZE = 1048576
+COMPRESSION_LEVEL = 6
+
+# Number of articles a reader process hands to a parser process at once.
+BATCH_SIZE = 64
+
+# Version of the information extracted from articles; increase it when
+# extraction changes so that records stored by earlier runs are dropped.
+RECORD_VERSION = 1
+
+# Elements that article information is extracted from even when they
+# appear outside of <front>; parsing keeps these and discards the rest.
+_KEPT_TAGS = frozenset([
+    'front',
+    'abstract',
+    'article-categories',
+    'copyright-statement',
+    'fig',
+    'kwd-group',
+    'supplementary-material'
+])
+
+# Elements that article information is extracted from, collected while
+# an article is parsed, see _ArticleParts.
+_PART_TAGS = frozenset([
+    'abstract',
+    'article-categories',
+    'article-id',
+    'article-meta',
+    'article-title',
+    'contrib',
+    'copyright-holder',
+    'copyright-statement',
+    'fig',
+    'front',
+    'journal-meta',
+    'kwd-group',
+    'license',
+    'pub-date',
+    'subject',
+    'supplementary-material'
+])
 
-# According to <ftp://ftp.ncbi.nlm.nih.gov/README.ftp>, this should be
-# 33554432 (32MiB) for best performance. Note that on slow connections,
-# however, huge buffers size leads to notable interface lag.
-BUFSIZE = 33554432
-#BUFSIZE = 1024000  # (1024KB)
+# Byte string every article with supplementary materials contains,
+# searched for before an article is parsed.
+_MEDIA_MARKER = '<media'
+
+# Counters kept while listing articles, e.g. statistics['prefilter']['avoided'].
+statistics = autovividict()
 
 def download_metadata(target_directory):
     """
     Downloads files from PubMed FTP server into given directory.
+
+    All archives are downloaded at the same time, each over several
+    connections (the “download-connections” option in the “performance”
+    section of the user configuration). Interrupted downloads are resumed
+    and an archive only replaces the local copy if it matches the MD5
+    checksum published next to it.
     """
     urls = [
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.A-B.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.C-H.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.I-N.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.O-Z.tar.gz'
+        'https://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.A-B.tar.gz',
+        'https://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.C-H.tar.gz',
+        'https://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.I-N.tar.gz',
+        'https://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.O-Z.tar.gz'
     ]
 
+    downloads = []
     for url in urls:
-        remote_file = urlopen(url)
-        total = int(remote_file.headers['content-length'])
-        completed = 0
-
         url_path = urlparse.urlsplit(url).path
         local_filename = path.join(target_directory, \
             url_path.split('/')[-1])
+        checksum = download.get_published_md5(url)
+        current_download = download.SegmentedDownload(url, local_filename, \
+            config.download_connections)
 
-        # if local file has same size as remote file, skip download
-        try:
-            if (path.getsize(local_filename) == total):
+        # if local file has same size and checksum as remote file, skip download
+        if _is_downloaded(local_filename, current_download.total, checksum):
+            continue
+        downloads.append((current_download, checksum))
+
+    if len(downloads) == 0:
+        return
+
+    for current_download, checksum in downloads:
+        current_download.start()
+    total = sum(d.total for d, checksum in downloads)
+    while True:
+        running = any(d.is_running() for d, checksum in downloads)
+        for current_download, checksum in downloads:
+            current_download.save_state()
+            current_download.update_digest()
+        yield {
+            'url': path.dirname(urls[0]) + '/',
+            'completed': sum(d.completed() for d, checksum in downloads),
+            'total': total
+        }
+        if not running:
+            break
+        sleep(1)
+
+    for current_download, checksum in downloads:
+        local_filename = current_download.local_filename
+        digest = current_download.finish(checksum)
+        download.set_local_md5(local_filename, digest)
+        if checksum is None:
+            stderr.write("No checksum published for <%s>.\n" % \
+                current_download.url)
+
+        stderr.write("Indexing “%s” … " % local_filename)
+        _build_index(local_filename, current_download.total, digest)
+        stderr.write("done.\n")
+
+def list_articles(target_directory, supplementary_materials=False, skip=None,
+    processes=None, records=None, no_media=None):
+    """
+    Iterates over archive files in target_directory, yielding article information.
+
+    skip is a seen-set (see helpers.seen) of article names; names of
+    yielded articles are added to it. Archive members are looked up in
+    the index of each archive, so only articles not in skip are
+    decompressed and archives without such articles are not read at all.
+
+    If more than one process is requested (defaulting to the “processes”
+    option in the “performance” section of the user configuration), each
+    archive is read by its own process and articles are parsed by a pool
+    of processes. Results are still yielded in the calling process, which
+    therefore keeps sole ownership of the database.
+
+    If supplementary materials are requested, articles without media are
+    not parsed (see _is_candidate) and not yielded.
+    Given a record store (see helpers.records), articles are then listed
+    from earlier results stored there and new results are added to it.
+    Given a store of articles without media (see helpers.records), such
+    articles are added to it and not read again while their files stay
+    the same.
+    """
+    if skip is None:
+        skip = set()
+    if processes is None:
+        processes = config.processes
+    if not supplementary_materials:
+        records = None  # stored records include supplementary materials
+        no_media = None
+    archives = []
+    keys = {}  # archive and modification time of articles to be parsed
+    for filename in listdir(target_directory):
+        if not filename.endswith('.tar.gz'):  # index or partial download
+            continue
+        archive_path = path.join(target_directory, filename)
+        points, members = _get_wanted_members(archive_path, skip)
+        unread_members = []
+        for member in members:
+            name, mtime = member[0], member[4]
+            if no_media is not None and no_media.get(name) == mtime:
+                statistics['no-media']['skipped'] += 1
+                continue
+            if records is not None:
+                try:
+                    result = records.get(filename, name, mtime)
+                except KeyError:  # article was not stored
+                    pass
+                else:
+                    statistics['records']['replayed'] += 1
+                    if result is not None:
+                        yield result
+                    elif no_media is not None:
+                        no_media.put(name, mtime)
+                    continue
+            keys[name] = filename, mtime
+            unread_members.append(member)
+        if unread_members:
+            archives.append((archive_path, points, unread_members))
+    if processes > 1:
+        results = _list_articles_parallel(archives, supplementary_materials, \
+            processes)
+    else:
+        results = _list_articles_serial(archives, supplementary_materials)
+    for name, result in results:
+        archive, mtime = keys[name]
+        if records is not None:
+            records.put(archive, name, mtime, result)
+            statistics['records']['stored'] += 1
+        if result is None:
+            if no_media is not None:
+                no_media.put(name, mtime)
+                statistics['no-media']['stored'] += 1
+            continue
+        yield result
+
+def _list_articles_serial(archives, supplementary_materials):
+    """
+    Parses articles from archives one after another, yielding name and
+    information of each article; information is None for articles that
+    were not parsed.
+    """
+    for archive_path, points, members in archives:
+        for name, content in _read_members(archive_path, points, members):
+            if supplementary_materials and not _is_candidate(content):
+                yield name, None
+                continue
+            yield name, _get_article(name, content, supplementary_materials)
+
+def _list_articles_parallel(archives, supplementary_materials, processes):
+    """
+    Reads archives and parses articles in worker processes, yielding the
+    same as _list_articles_serial, though not in archive order.
+
+    Workers send their statistics along with every list of results they
+    put into the result queue. A parser puts its number into the result
+    queue when it stops; a worker that exits without doing so, e.g. after
+    being killed for lack of memory, makes this raise RuntimeError.
+    """
+    batches = Queue(processes * 2)
+    results = Queue()
+    readers = [
+        Process(target=_read_archive, args=(archive_path, points, members, \
+            batches, results, supplementary_materials)) \
+            for archive_path, points, members in archives
+    ]
+    parsers = [
+        Process(target=_parse_batches, args=(i, batches, results, \
+            supplementary_materials)) for i in xrange(processes)
+    ]
+    for process in readers + parsers:
+        process.daemon = True
+        process.start()
+
+    stopped = set()  # numbers of parsers that have stopped
+    stop_signals_sent = 0
+    try:
+        while len(stopped) < len(parsers):
+            # a parser that exits normally has put its number into the
+            # result queue before, any other exit means results are lost
+            for i, process in enumerate(parsers):
+                if i not in stopped and process.exitcode not in (None, 0):
+                    raise RuntimeError, \
+                        'Parser process exited with code %d.' % process.exitcode
+            for process in readers:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError, \
+                        'Reader process exited with code %d.' % process.exitcode
+            # parsers are told to stop once every reader has finished, as
+            # readers only exit after their queued batches were flushed
+            if stop_signals_sent < len(parsers) and \
+                not any(reader.is_alive() for reader in readers):
+                try:
+                    batches.put_nowait(None)
+                    stop_signals_sent += 1
+                    continue
+                except Full:
+                    pass
+            try:
+                item = results.get(timeout=1)
+            except Empty:
+                continue
+            if isinstance(item, int):  # a parser has stopped
+                stopped.add(item)
                 continue
-        except OSError:  # local file does not exist
+            if isinstance(item, basestring):  # a worker failed
+                raise RuntimeError, item
+            batch, worker_statistics = item
+            _add_statistics(worker_statistics)
+            for result in batch:
+                yield result
+    finally:
+        for process in readers + parsers:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+def _read_archive(archive_path, points, members, batches, results,
+    supplementary_materials):
+    """
+    Puts batches of article file names and contents from an archive
+    into a queue. Articles that need not be parsed are put directly into
+    the result queue.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # parent handles ^C
+    try:
+        batch = []
+        unparsed = []
+        for name, content in _read_members(archive_path, points, members):
+            if supplementary_materials and not _is_candidate(content):
+                unparsed.append((name, None))
+                continue
+            batch.append((name, content))
+            if len(batch) == BATCH_SIZE:
+                batches.put(batch)
+                batch = []
+            if len(unparsed) == BATCH_SIZE:
+                results.put((unparsed, _take_statistics()))
+                unparsed = []
+        if batch:
+            batches.put(batch)
+        results.put((unparsed, _take_statistics()))
+    except Exception:
+        results.put(traceback.format_exc())
+
+def _parse_batches(number, batches, results, supplementary_materials):
+    """
+    Parses batches of articles from one queue, putting lists of
+    results into another, followed by the number of the parser.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # parent handles ^C
+    try:
+        for batch in iter(batches.get, None):
+            results.put(([
+                (name, _get_article(name, content, supplementary_materials)) \
+                    for name, content in batch
+            ], _take_statistics()))
+    except Exception:
+        results.put(traceback.format_exc())
+        return
+    results.put(number)
+
+def _take_statistics():
+    """
+    Returns statistics as plain dictionaries and resets them, so that a
+    worker process can send them to its parent.
+    """
+    taken = dict((key, dict(counts)) for key, counts in statistics.items())
+    statistics.clear()
+    return taken
+
+def _add_statistics(taken):
+    for key, counts in taken.items():
+        for name, count in counts.items():
+            statistics[key][name] += count
+
+def _is_candidate(content):
+    """
+    Given the XML of an article as bytes, returns whether it can hold
+    media. Only candidates need to be parsed; articles without licensing
+    information are parsed too, as they are stored and counted as
+    non-free by “oa-cache stats”.
+    """
+    if _MEDIA_MARKER in content:
+        statistics['prefilter']['parsed'] += 1
+        return True
+    statistics['prefilter']['avoided'] += 1
+    return False
+
+def _get_index_path(archive_path):
+    return archive_path + '.index'
+
+class _Recompressor(object):
+    """
+    File-like object returning the uncompressed contents of a gzip file
+    as they are read, while writing them to target as a gzip file made
+    of independent members of MEMBER_SIZE uncompressed bytes each.
+
+    Every member starts a new deflate stream, so decompression can start
+    at any of them. Their uncompressed and compressed offsets are listed
+    in points.
+    """
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buffer = ''  # decompressed data not yet read
+        self.position = 0  # in uncompressed data
+        self.member = None  # gzip member being written
+        self.member_size = 0
+        self.points = []
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            chunk = self.source.read(BUFSIZE)
+            if chunk == '':
+                break
+            data = self.decompressor.decompress(chunk)
+            while self.decompressor.unused_data:  # next gzip member
+                chunk = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data += self.decompressor.decompress(chunk)
+            self.buffer += data
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self._write(data)
+        return data
+
+    def _write(self, data):
+        while data:
+            if self.member is None:
+                self.points.append((self.position, self.target.tell()))
+                self.member = gzip.GzipFile('', 'wb', COMPRESSION_LEVEL,
+                    self.target, 0)
+                self.member_size = 0
+            part = data[:MEMBER_SIZE - self.member_size]
+            self.member.write(part)
+            self.member_size += len(part)
+            self.position += len(part)
+            data = data[len(part):]
+            if self.member_size == MEMBER_SIZE:
+                self.member.close()  # leaves target open
+                self.member = None
+
+    def close(self):
+        """
+        Copies the rest of the source, e.g. the blocks ending a tar file,
+        and finishes the last member.
+        """
+        while self.read(BUFSIZE):
             pass
+        if self.member is not None:
+            self.member.close()
+            self.member = None
+
+def _build_index(archive_path, source_size=None, source_md5=None):
+    """
+    Recompresses an archive so that it can be read from any of its
+    restart points (see _Recompressor) and writes an index next to it.
+
+    The first line of the index holds size and modification time of the
+    recompressed archive, size and MD5 checksum of the archive as it was
+    downloaded (by default, as it is now) and the number of restart
+    points. Each of the following lines holds the uncompressed and the
+    compressed offset of a restart point; every other line holds name,
+    header offset, data offset, size and modification time of a file.
+    Offsets of files are positions in the uncompressed archive. All
+    fields are separated by tabs.
+    """
+    if source_size is None:
+        source_size = path.getsize(archive_path)
+    if source_md5 is None:
+        source_md5 = download.get_local_md5(archive_path)
+    index_path = _get_index_path(archive_path)
+    temporary_path = archive_path + '.tmp'
+    files = []
+    with open(archive_path, 'rb') as source:
+        with open(temporary_path, 'wb') as target:
+            recompressor = _Recompressor(source, target)
+            archive = tarfile.open(fileobj=recompressor, mode='r|')
+            for item in archive:
+                if item.isfile():
+                    files.append((item.name, item.offset, item.offset_data,
+                        item.size, item.mtime))
+                archive.members = []  # do not keep every TarInfo in memory
+            recompressor.close()
+    with open(index_path + '.part', 'w') as index_file:
+        index_file.write('%d\t%d\t%d\t%s\t%d\n' % (
+            _get_archive_stat(temporary_path) + \
+                (source_size, source_md5, len(recompressor.points))
+        ))
+        for point in recompressor.points:
+            index_file.write('%d\t%d\n' % point)
+        for item in files:
+            index_file.write('%s\t%d\t%d\t%d\t%d\n' % item)
+    rename(temporary_path, archive_path)  # stat in index stays valid
+    rename(index_path + '.part', index_path)
+
+def _get_archive_stat(archive_path):
+    stat = path.getsize(archive_path), int(path.getmtime(archive_path))
+    return stat
+
+def _read_index_header(index_file, archive_path):
+    """
+    Reads the first line of an index, returning size and MD5 checksum
+    of the downloaded archive and the number of restart points, or None
+    if the index belongs to an earlier download or an older format.
+    """
+    fields = index_file.readline().rstrip('\n').split('\t')
+    if len(fields) != 5:
+        return None
+    size, mtime, source_size, points = [int(fields[i]) for i in (0, 1, 2, 4)]
+    if (size, mtime) != _get_archive_stat(archive_path):
+        return None
+    return source_size, fields[3], points
 
-        with open(local_filename,'wb') as local_file:
-            while True:
-                chunk = remote_file.read(BUFSIZE)
-                if chunk != '':
-                    local_file.write(chunk)
-                    completed += len(chunk)
-                    yield {
-                        'url': url,
-                        'completed': completed,
-                        'total': total
-                    }
+def _is_downloaded(archive_path, size, checksum):
+    """
+    Returns whether a local archive was downloaded from a remote file of
+    the given size and MD5 checksum (None if unknown). Indexed archives
+    are recompressed, so the index holds size and checksum of the
+    download.
+    """
+    try:
+        with open(_get_index_path(archive_path)) as index_file:
+            header = _read_index_header(index_file, archive_path)
+    except (IOError, OSError, ValueError):  # no index or no archive
+        header = None
+    try:
+        if header is None:
+            source_size, source_md5 = path.getsize(archive_path), None
+        else:
+            source_size, source_md5 = header[:2]
+    except OSError:  # local file does not exist
+        return False
+    if source_size != size:
+        return False
+    if checksum is None:
+        return True
+    if source_md5 is None:
+        source_md5 = download.get_local_md5(archive_path)
+    return source_md5 == checksum
+
+def _get_index(archive_path):
+    """
+    Returns restart points and files of an archive, building the archive
+    index first if it is missing or belongs to an earlier download.
+
+    Restart points are given as tuples of uncompressed and compressed
+    offset; files as tuples of name, header offset, data offset, size
+    and modification time.
+    """
+    index_path = _get_index_path(archive_path)
+    try:
+        with open(index_path) as index_file:
+            header = _read_index_header(index_file, archive_path)
+            if header is not None:
+                points = []
+                for i in xrange(header[2]):
+                    points.append(tuple(
+                        int(f) for f in index_file.readline().split('\t')
+                    ))
+                files = []
+                for line in index_file:
+                    fields = line.rstrip('\n').split('\t')
+                    files.append((fields[0],) + tuple(int(f) for f in fields[1:]))
+                return points, files
+    except (IOError, ValueError):  # index does not exist or is incomplete
+        pass
+    stderr.write("Indexing “%s” … " % archive_path)
+    _build_index(archive_path)
+    stderr.write("done.\n")
+    return _get_index(archive_path)
+
+def _get_wanted_members(archive_path, skip):
+    """
+    Returns restart points and index entries of article files in an
+    archive that are not in skip.
+    """
+    points, files = _get_index(archive_path)
+    members = []
+    for member in files:
+        name = member[0]
+        if name in skip:
+            continue
+        if path.splitext(name)[1] == '.nxml':
+            skip.add(name)  # guard against duplicate input
+            members.append(member)
+    return points, members
+
+def _read_members(archive_path, points, members):
+    """
+    Given restart points and index entries in archive order, yields name
+    and content of each file.
+
+    Decompression starts at the last restart point before the first
+    requested file and goes on from there, unless a later file starts
+    beyond the next restart point, in which case decompression starts
+    again at the last restart point before that file. Data between
+    requested files is decompressed and discarded without being parsed
+    as part of the archive.
+    """
+    starts = [start for start, offset in points]
+    decompressor = None
+    buffer = ''  # decompressed data not yet discarded
+    position = 0  # offset of buffer in uncompressed archive
+    with open(archive_path, 'rb') as archive:
+        for name, offset, offset_data, size, mtime in members:
+            end = offset_data + size
+            i = max(0, bisect_right(starts, offset_data) - 1)
+            if decompressor is None or starts[i] > position + len(buffer):
+                archive.seek(points[i][1])
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                buffer = ''
+                position = starts[i]
+            while position + len(buffer) < end:
+                chunk = archive.read(BUFSIZE)
+                if chunk == '':
+                    raise EOFError, 'Archive “%s” is truncated.' % archive_path
+                data = decompressor.decompress(chunk)
+                while decompressor.unused_data:  # next gzip member
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    data += decompressor.decompress(chunk)
+                if position + len(buffer) <= offset_data:
+                    position += len(buffer)
+                    buffer = data
                 else:
-                    break
+                    buffer = buffer[offset_data - position:] + data
+                    position = offset_data
+            content = buffer[offset_data - position:end - position]
+            yield name, content
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+class _ArticleParts(object):
     """
-    Iterates over archive files in target_directory, yielding article information.
+    Elements of an article that article information is extracted from,
+    collected while the article is parsed, so that the _get_* functions
+    do not search the article again.
+
+    Elements are given in the order ElementTree finds them with the paths
+    in the comments below, so that the _get_* functions return the same
+    as they did searching the article tree. Candidates for paths of the
+    form “.//*tag” are ordered by the position of their parent first.
     """
-    listing = listdir(target_directory)
-    for filename in listing:
-        with tarfile.open(path.join(target_directory, filename)) as archive:
-            for item in archive:
-                if item.name in skip:
-                    continue
-                if path.splitext(item.name)[1] == '.nxml':
-                    content = archive.extractfile(item)
-                    tree = ElementTree()
-                    tree.parse(content)
-
-                    result = {}
-                    result['name'] = item.name
-                    skip.append(item.name)  # guard against duplicate input
-                    result['doi'] = _get_article_doi(tree)
-                    result['article-contrib-authors'] = _get_article_contrib_authors(tree)
-                    result['article-title'] = _get_article_title(tree)
-                    result['article-abstract'] = _get_article_abstract(tree)
-                    result['journal-title'] = _get_journal_title(tree)
-                    result['article-year'], \
-                        result['article-month'], \
-                        result['article-day'] = _get_article_date(tree)
-                    result['article-url'] = _get_article_url(tree)
-                    result['article-license-url'], \
-                        result['article-license-text'], \
-                        result['article-copyright-statement'] = _get_article_licensing(tree)
-                    result['article-copyright-holder'] = _get_article_copyright_holder(tree)
-                    result['article-categories'] = _get_article_categories(tree)
-
-                    if supplementary_materials:
-                        result['supplementary-materials'] = _get_supplementary_materials(tree)
-                    yield result
+    def __init__(self, depth):
+        self.depth = depth  # number of elements containing the article
+        self.front = None  # find('front')
+        self.front_elements = {  # front.iter(tag)
+            'article-id': [],
+            'contrib': [],
+            'journal-meta': []
+        }
+        self.article_meta = None  # find('front/article-meta')
+        self.pub_dates = []  # article_meta.iter('pub-date')
+        self.article_title = None  # find('front/article-meta/title-group/article-title')
+        self.subject = None  # find('front/article-meta/article-categories/subj-group/subject')
+        self.copyright_holder = None  # find('front/article-meta/permissions/copyright-holder')
+        self.descendants = {  # iter(tag)
+            'fig': [],
+            'supplementary-material': []
+        }
+        self.found = {}  # tag → keys and elements for find('.//*tag')
+        self.found_in_front = {}  # tag → keys and elements for find('front//*tag')
+
+    def add(self, element, position, stack, positions):
+        """
+        Adds an element that has just started at the given position in
+        the document, inside the elements on stack, which started at the
+        given positions.
+        """
+        tag = element.tag
+        ancestors = stack[self.depth + 1:]  # inside the article
+        if tag in self.descendants:
+            self.descendants[tag].append(element)
+            return
+        if tag == 'front':
+            if not ancestors and self.front is None:
+                self.front = element
+            return
+        if not ancestors:
+            return
+        key = (positions[-1], position)  # parent first, see above
+        if tag in self.front_elements:
+            if ancestors[0] is self.front:
+                self.front_elements[tag].append(element)
+            return
+        if tag == 'pub-date':
+            if len(ancestors) >= 2 and self.article_meta is not None and \
+                ancestors[1] is self.article_meta:
+                self.pub_dates.append(element)
+            return
+        tags = [ancestor.tag for ancestor in ancestors[:5]]
+        if tag == 'article-meta':
+            if tags == ['front'] and self.article_meta is None:
+                self.article_meta = element
+        elif tag == 'article-title':
+            if tags == ['front', 'article-meta', 'title-group'] and \
+                self.article_title is None:
+                self.article_title = element
+        elif tag == 'subject':
+            if tags == ['front', 'article-meta', 'article-categories',
+                'subj-group'] and self.subject is None:
+                self.subject = element
+        elif tag == 'copyright-holder':
+            if tags == ['front', 'article-meta', 'permissions'] and \
+                self.copyright_holder is None:
+                self.copyright_holder = element
+        else:
+            self.found.setdefault(tag, []).append((key, element))
+            if len(ancestors) >= 2 and tags[0] == 'front':
+                self.found_in_front.setdefault(tag, []).append((key, element))
+
+    def iter_front(self, tag):
+        """
+        Returns elements with tag inside the first <front> element,
+        raising AttributeError like front.iter(tag) if there is none.
+        """
+        if self.front is None:
+            raise AttributeError, 'No <front> element found.'
+        return self.front_elements[tag]
+
+    def iterfind(self, tag):
+        return [element for key, element in sorted(self.found.get(tag, []))]
+
+    def find(self, tag):
+        found = self.found.get(tag)
+        if found:
+            return min(found)[1]
+
+    def find_in_front(self, tag):
+        found = self.found_in_front.get(tag)
+        if found:
+            return min(found)[1]
+
+def _iterparse_articles(source):
+    """
+    Parses XML incrementally, yielding the parts (see _ArticleParts) of
+    each <article> element once it is complete.
+
+    Elements listed in _KEPT_TAGS are kept intact; every other element
+    is cleared as soon as it has been parsed. Parts of articles are
+    either kept or inside <front>, which is kept.
+    """
+    stack = []  # open elements
+    push = stack.append
+    pop = stack.pop
+    positions = []  # of open elements in the document
+    push_position = positions.append
+    pop_position = positions.pop
+    position = 0
+    parts = None
+    kept_depth = 0  # nesting depth inside a kept element
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            tag = element.tag
+            if tag == 'article':
+                parts = _ArticleParts(len(stack))
+            elif parts is not None and tag in _PART_TAGS:
+                parts.add(element, position, stack, positions)
+            if kept_depth or tag in _KEPT_TAGS:
+                kept_depth += 1
+            push(element)
+            push_position(position)
+            position += 1
+            continue
+
+        pop()
+        pop_position()
+        if kept_depth:
+            kept_depth -= 1
+            continue
+        if element.tag == 'article':
+            yield parts
+            parts = None
+        element.clear()
+
+def _get_article(name, content, supplementary_materials):
+    """
+    Given file name and content of an article, returns article information.
+    """
+    for parts in _iterparse_articles(StringIO(content)):
+        return _get_article_information(name, parts, supplementary_materials)
+
+def _get_article_information(name, parts, supplementary_materials):
+    """
+    Given file name and parts of an article, returns article information.
+    """
+    result = {}
+    result['name'] = name
+    result['doi'] = _get_article_doi(parts)
+    result['article-contrib-authors'] = _get_article_contrib_authors(parts)
+    result['article-title'] = _get_article_title(parts)
+    result['article-abstract'] = _get_article_abstract(parts)
+    result['journal-title'] = _get_journal_title(parts)
+    result['article-year'], \
+        result['article-month'], \
+        result['article-day'] = _get_article_date(parts)
+    result['article-url'] = _get_article_url(parts)
+    result['article-license-url'], \
+        result['article-license-text'], \
+        result['article-copyright-statement'] = _get_article_licensing(parts)
+    result['article-copyright-holder'] = _get_article_copyright_holder(parts)
+    result['article-categories'] = _get_article_categories(parts)
+
+    if supplementary_materials:
+        result['supplementary-materials'] = _get_supplementary_materials(parts)
+    return result
 
 def _strip_whitespace(text):
     """
@@ -106,12 +799,12 @@ def _strip_whitespace(text):
     )
     return text.strip('\n')
 
-def _get_article_categories(tree):
+def _get_article_categories(parts):
     """
-    Given an ElementTree, return (some) article categories.
+    Given parts of an article, return (some) article categories.
     """
     categories = []
-    article_categories = ElementTree(tree).find('.//*article-categories')
+    article_categories = parts.find('article-categories')
     for subject_group in article_categories.iter('subj-group'):
         try:
             if subject_group.attrib['subj-group-type'] == 'heading':
@@ -129,7 +822,7 @@ def _get_article_categories(tree):
                 category_text not in categories:
                 categories.append(category_text)
     keywords = []
-    article_keywords = ElementTree(tree).find('.//*kwd-group')
+    article_keywords = parts.find('kwd-group')
     if article_keywords != None:
         for keyword in article_keywords.iter('kwd'):
             if keyword.text is None:
@@ -137,13 +830,12 @@ def _get_article_categories(tree):
             keywords.append(keyword.text)
     return categories+keywords
 
-def _get_article_contrib_authors(tree):
+def _get_article_contrib_authors(parts):
     """
-    Given an ElementTree, returns article authors in a format suitable for citation.
+    Given parts of an article, returns article authors in a format suitable for citation.
     """
     authors = []
-    front = ElementTree(tree).find('front')
-    for contrib in front.iter('contrib'):
+    for contrib in parts.iter_front('contrib'):
         if contrib.attrib['contrib-type'] != 'author':
             continue
         contribTree = ElementTree(contrib)
@@ -170,32 +862,31 @@ def _get_article_contrib_authors(tree):
 
     return ', '.join(authors)
 
-def _get_article_title(tree):
+def _get_article_title(parts):
     """
-    Given an ElementTree, returns article title.
+    Given parts of an article, returns article title.
     """
-    title = ElementTree(tree).find('front/article-meta/title-group/article-title')
+    title = parts.article_title
     if title is None:
-        title = ElementTree(tree).find('front/article-meta/article-categories/subj-group/subject')
+        title = parts.subject
     return ''.join(title.itertext())
 
-def _get_article_abstract(tree):
+def _get_article_abstract(parts):
     """
-    Given an ElementTree, returns article abstract.
+    Given parts of an article, returns article abstract.
     """
-    for abstract in ElementTree(tree).iterfind('.//*abstract'):
+    for abstract in parts.iterfind('abstract'):
         if 'abstract-type' in abstract.attrib:  # toc or summary
             continue
         else:
             return _strip_whitespace(''.join(abstract.itertext()))
     return None
 
-def _get_journal_title(tree):
+def _get_journal_title(parts):
     """
-    Given an ElementTree, returns journal title.
+    Given parts of an article, returns journal title.
     """
-    front = ElementTree(tree).find('front')
-    for journal_meta in front.iter('journal-meta'):
+    for journal_meta in parts.iter_front('journal-meta'):
         for journal_title in journal_meta.iter('journal-title'):
             title = journal_title.text
             # take only the part before the colon, strip whitespace
@@ -203,13 +894,14 @@ def _get_journal_title(tree):
             title = title.replace('PLoS', 'PLOS').replace('PloS', 'PLOS')
             return title
 
-def _get_article_date(tree):
+def _get_article_date(parts):
     """
-    Given an ElementTree, returns article date as list of integers in
-    the format [year, month, day].
+    Given parts of an article, returns article date as list of integers
+    in the format [year, month, day].
     """
-    article_meta = tree.find('front/article-meta')
-    for pub_date in article_meta.iter('pub-date'):
+    if parts.article_meta is None:
+        raise AttributeError, 'No <article-meta> element found.'
+    for pub_date in parts.pub_dates:
         year = int(pub_date.find('year').text)
         try:
             month = int(pub_date.find('month').text)
@@ -222,11 +914,11 @@ def _get_article_date(tree):
         return year, month, day
     raise RuntimeError, 'No date information found.'
 
-def _get_article_url(tree):
+def _get_article_url(parts):
     """
-    Given an ElementTree, returns article URL.
+    Given parts of an article, returns article URL.
     """
-    doi = _get_article_doi(tree)
+    doi = _get_article_doi(parts)
     if doi:
         return 'http://dx.doi.org/' + doi
 
@@ -477,21 +1169,93 @@ license_url_fixes = {
     'http://creativecommons.org/licenses/by/4.0/legalcode': 'http://creativecommons.org/licenses/by/4.0/'
 }
 
-def _get_article_licensing(tree):
+# ASCII whitespace, as removed by str.split()
+_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r\f\v]+')
+
+def _normalize_text(text):
+    """
+    Given text, returns it with runs of whitespace replaced by a single
+    space and without leading or trailing whitespace.
     """
-    Given an ElementTree, returns article license URL.
+    return _WHITESPACE_PATTERN.sub(' ', text).strip(' ')
+
+class _LicenseTable(object):
+    """
+    Compiled form of a table mapping statements to license URLs, looked
+    up like a dictionary. Statements in the table are normalised with
+    _normalize_text, so lookups do not depend on their whitespace.
+
+    If suffixes is true, a text that is not in the table matches the
+    longest statement it ends with. The end of the text is looked up
+    once for every length of statement in the table, so the cost of a
+    lookup grows with the number of distinct lengths, not of statements.
+
+    Hits and misses are counted in statistics under the given name.
+    """
+    def __init__(self, name, table, suffixes=False):
+        self.name = name
+        self.exact = {}
+        for statement, url in table.items():
+            self.exact[_normalize_text(statement.decode('utf-8'))] = url
+        self.suffix_lengths = None
+        if suffixes:
+            self.suffix_lengths = sorted(
+                set(len(statement) for statement in self.exact),
+                reverse=True
+            )
+
+    def _get_suffix(self, text):
+        for length in self.suffix_lengths:
+            if length <= len(text):
+                suffix = text[len(text) - length:]
+                if suffix in self.exact:
+                    return self.exact[suffix]
+        raise KeyError, text
+
+    def __getitem__(self, text):
+        try:
+            try:
+                url = self.exact[text]
+            except KeyError:
+                if self.suffix_lengths is None:
+                    raise
+                url = self._get_suffix(text)
+        except KeyError:
+            statistics[self.name]['misses'] += 1
+            raise
+        statistics[self.name]['hits'] += 1
+        return url
+
+_license_statements = _LicenseTable(
+    'license-url-equivalents',
+    license_url_equivalents
+)
+_copyright_statements = _LicenseTable(
+    'copyright-statement-url-equivalents',
+    copyright_statement_url_equivalents,
+    suffixes=True
+)
+_license_url_fixes = _LicenseTable('license-url-fixes', license_url_fixes)
+
+# Records (see helpers.records) are also stale when a license table changes.
+record_version = '%d-%s' % (RECORD_VERSION, md5(repr([
+    sorted(table.items()) for table in (license_url_equivalents,
+        copyright_statement_url_equivalents, license_url_fixes)
+])).hexdigest())
+
+def _get_article_licensing(parts):
+    """
+    Given parts of an article, returns article license URL.
     """
     license_text = None
     license_url = None
     copyright_statement_text = None
 
-    license = tree.find('front//*license')
-    copyright_statement = tree.find('front//*copyright-statement')
+    license = parts.find_in_front('license')
+    copyright_statement = parts.find_in_front('copyright-statement')
 
     def _get_text_from_element(element):
-        text = ' '.join(element.itertext()).encode('utf-8')  # clean encoding
-        text = ' '.join(text.split())  # clean whitespace
-        return text
+        return _normalize_text(u' '.join(element.itertext()))
 
     if license is not None:
         try:
@@ -512,44 +1276,31 @@ def _get_article_licensing(tree):
 
     if license_url is None:
         if license_text is not None:
-           try:
-               license_url = license_url_equivalents[license_text]
-           except:
-             logging.error('Unknown license: %s', license_text)
+            try:
+                license_url = _license_statements[license_text]
+            except KeyError:
+                logging.error('Unknown license: %s', license_text)
 
         elif copyright_statement_text is not None:
-            copyright_statement_found = False
-            for text in copyright_statement_url_equivalents.keys():
-                if copyright_statement_text.endswith(text):
-                    license_url = copyright_statement_url_equivalents[text]
-                    copyright_statement_found = True
-                    break
-            if not copyright_statement_found:
+            try:
+                license_url = _copyright_statements[copyright_statement_text]
+            except KeyError:
                 logging.error('Unknown copyright statement: %s', copyright_statement_text)
 
-    def _fix_license_url(license_url):
-        if license_url in license_url_fixes.keys():
-            return license_url_fixes[license_url]
-        return license_url
-
-    if license_text is not None:
-        license_text = license_text.decode('utf-8')
-
-    if copyright_statement_text is not None:
-        copyright_statement_text = copyright_statement_text.decode('utf-8')
-
     if license_url is not None:
-        return _fix_license_url(license_url), license_text, copyright_statement_text
+        try:
+            license_url = _license_url_fixes[license_url]
+        except KeyError:  # license URL needs no fix
+            pass
+        return license_url, license_text, copyright_statement_text
     else:
         return None, license_text, copyright_statement_text
 
-def _get_article_copyright_holder(tree):
+def _get_article_copyright_holder(parts):
     """
-    Given an ElementTree, returns article copyright holder.
+    Given parts of an article, returns article copyright holder.
     """
-    copyright_holder = tree.find(
-        'front/article-meta/permissions/copyright-holder'
-    )
+    copyright_holder = parts.copyright_holder
     try:
         copyright_holder = copyright_holder.text
         if copyright_holder is not None:
@@ -557,7 +1308,7 @@ def _get_article_copyright_holder(tree):
     except AttributeError:  # no copyright_holder known
         pass
 
-    copyright_statement = tree.find('.//*copyright-statement')
+    copyright_statement = parts.find('copyright-statement')
     try:
         copyright_statement = copyright_statement.text
         if copyright_statement is not None:
@@ -567,25 +1318,27 @@ def _get_article_copyright_holder(tree):
 
     return None
 
-def _get_supplementary_materials(tree):
+def _get_supplementary_materials(parts):
     """
-    Given an ElementTree, returns a list of article supplementary materials.
+    Given parts of an article, returns a list of article supplementary materials.
     """
     materials = []
-    for sup in tree.iter('supplementary-material'):
-        material = _get_supplementary_material(tree, sup)
+    pmcid = _get_pmcid(parts)
+    for sup in parts.descendants['supplementary-material']:
+        material = _get_supplementary_material(pmcid, sup)
         if material is not None:
             materials.append(material)
-    for fig in tree.iter('fig'):
-        material = _get_supplementary_material(tree, fig)
+    for fig in parts.descendants['fig']:
+        material = _get_supplementary_material(pmcid, fig)
         if material is not None:
             materials.append(material)
     return materials
 
-def _get_supplementary_material(tree, sup):
+def _get_supplementary_material(pmcid, sup):
     """
-    Given an ElementTree returns supplementary materials as a
-    dictionary containing url, mimetype and label and caption.
+    Given a PubMed Central ID and an element, returns supplementary
+    materials as a dictionary containing url, mimetype and label and
+    caption.
     """
     result = {}
     sup_tree = ElementTree(sup)
@@ -625,26 +1378,24 @@ def _get_supplementary_material(tree, sup):
             result['mimetype'] = ''
             result['mime-subtype'] = ''
         result['url'] = _get_supplementary_material_url(
-            _get_pmcid(tree),
+            pmcid,
             media.attrib['{http://www.w3.org/1999/xlink}href']
         )
         return result
 
-def _get_pmcid(tree):
+def _get_pmcid(parts):
     """
-    Given an ElementTree, returns PubMed Central ID.
+    Given parts of an article, returns PubMed Central ID.
     """
-    front = ElementTree(tree).find('front')
-    for article_id in front.iter('article-id'):
+    for article_id in parts.iter_front('article-id'):
         if article_id.attrib['pub-id-type'] == 'pmc':
             return article_id.text
 
-def _get_article_doi(tree):
+def _get_article_doi(parts):
     """
-    Given an ElementTree, returns DOI.
+    Given parts of an article, returns DOI.
     """
-    front = ElementTree(tree).find('front')
-    for article_id in front.iter('article-id'):
+    for article_id in parts.iter_front('article-id'):
         try:
             if article_id.attrib['pub-id-type'] == 'doi':
                 return article_id.text
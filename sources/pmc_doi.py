@@ -1,29 +1,50 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from urllib2 import urlopen, urlparse, Request, HTTPError
+from cStringIO import StringIO
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from urllib import urlencode
+from urllib2 import urlopen, urlparse, Request, HTTPError, URLError
 from xml.etree.cElementTree import dump, ElementTree
-from os import listdir, path
-from sys import stdin, stderr
+from os import listdir, path, remove
+from sys import exit, stdin, stderr
 
+import re
+
+from helpers import eutils, ncbi
 from pmc import _get_article_contrib_authors, _get_article_title, _get_article_abstract, \
     _get_journal_title, _get_article_date, _get_article_url, _get_article_licensing, \
     _get_article_copyright_holder, _get_supplementary_materials, _get_pmcid, _get_article_doi, \
-    _get_article_categories
+    _get_article_categories, _is_candidate, _iterparse_articles, record_version, \
+    statistics
+
+# first start tag of a document and the <article> elements within it
+_ROOT_PATTERN = re.compile(r'<([A-Za-z_][^\s/>]*)[^>]*>')
+_ARTICLE_PATTERN = re.compile(r'<article[\s>].*?</article>', re.DOTALL)
+
+# Above this number of IDs, IDs are sent in request bodies and articles
+# are fetched in batches from the history server, not listed in URLs.
+HISTORY_THRESHOLD = 200
+DOI_BATCH_SIZE = 1000
+EFETCH_BATCH_SIZE = 500
+
+BUFSIZE = 1024000  # (1024KB)
+
+EUTILS_URL = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+USER_AGENT = 'pmc_doi/2012-07-14'
 
 def _get_file_from_url(url):
-    req = Request(url, None, {'User-Agent' : 'pmc_doi/2012-07-14'})
-    try:
-        remote_file = urlopen(req)
-        return remote_file
-    except HTTPError as e:
-        stderr.write('When trying to download <%s>, the following error occured: “%s”.\n' % \
-            (url, str(e)))
-        exit(255)
+    return eutils.get_file_from_url(url, USER_AGENT)
+
+def _get_file_from_post(endpoint, parameters):
+    return eutils.get_file_from_post(EUTILS_URL + endpoint, parameters, USER_AGENT)
 
 def _get_pmcids_from_dois(dois):
-    url = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pmc&term=%s' % \
-        '%20OR%20'.join([doi+'[doi]' for doi in dois])
+    if len(dois) > HISTORY_THRESHOLD:
+        return _get_pmcids_from_dois_in_batches(dois)
+    url = EUTILS_URL + 'esearch.fcgi?db=pmc&retmax=%d&term=%s' % \
+        (2 * len(dois), '%20OR%20'.join([doi+'[doi]' for doi in dois]))
     xml_file = _get_file_from_url(url)
     tree = ElementTree()
     tree.parse(xml_file)
@@ -32,8 +53,44 @@ def _get_pmcids_from_dois(dois):
         pmcids.append(e.text)
     return pmcids
 
+def _get_pmcids_from_dois_in_batches(dois):
+    pmcids = []
+    for start in xrange(0, len(dois), DOI_BATCH_SIZE):
+        batch = dois[start:start + DOI_BATCH_SIZE]
+        xml_file = _get_file_from_post('esearch.fcgi', {
+            'db': 'pmc',
+            'retmax': 2 * len(batch),
+            'term': ' OR '.join([doi+'[doi]' for doi in batch])
+        })
+        tree = ElementTree()
+        tree.parse(xml_file)
+        for e in tree.iterfind('IdList/Id'):
+            pmcids.append(e.text)
+    return pmcids
+
+def _post_pmcids(pmcids):
+    """
+    Stores PMCIDs on the history server, returning WebEnv and query key.
+    """
+    xml_file = _get_file_from_post('epost.fcgi', {
+        'db': 'pmc',
+        'id': ','.join(pmcids)
+    })
+    tree = ElementTree()
+    tree.parse(xml_file)
+    return tree.findtext('WebEnv'), tree.findtext('QueryKey')
+
+def _get_query_url_from_history(webenv, query_key, retstart, retmax):
+    return EUTILS_URL + 'efetch.fcgi?' + urlencode([
+        ('db', 'pmc'),
+        ('WebEnv', webenv),
+        ('query_key', query_key),
+        ('retstart', retstart),
+        ('retmax', retmax)
+    ])
+
 def _get_query_url_from_pmcids(pmcids):
-    return 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pmc&id=%s' % \
+    return EUTILS_URL + 'efetch.fcgi?db=pmc&id=%s' % \
         '&id='.join(pmcids)
 
 def _get_file_from_pmcids(pmcids):
@@ -44,6 +101,10 @@ def _get_file_from_pmcids(pmcids):
 def download_metadata(target_directory):
     """
     Downloads XML files for DOIs on stdin into given directory.
+
+    For more than HISTORY_THRESHOLD articles, the articles are posted to
+    the history server and fetched in batches of EFETCH_BATCH_SIZE, each
+    streamed into a file of its own.
     """
     stderr.write('Input DOIs, delimited by whitespace: ')
     dois = stdin.read().split()
@@ -54,47 +115,170 @@ def download_metadata(target_directory):
     pmcids = _get_pmcids_from_dois(dois)
     if len(pmcids) == 0:
         raise RuntimeError, 'No PubMed Central IDs for given DOIs found.'
+    if len(pmcids) > HISTORY_THRESHOLD:
+        stderr.write('found: %d\n' % len(pmcids))
+        for result in _download_metadata_from_history(target_directory, pmcids):
+            yield result
+        return
     stderr.write('found: %s\n' % ', '.join(pmcids))
 
     url = _get_query_url_from_pmcids(pmcids)
     yield { 'url': url, 'completed': 0, 'total': 1 }
 
     url_path = urlparse.urlsplit(url).path
-    local_filename = path.join(target_directory, \
-        url_path.split('/')[-1])
+    filename = url_path.split('/')[-1]
+    _remove_files_except(target_directory, [filename])
+    local_filename = path.join(target_directory, filename)
     with open(local_filename, 'wb') as local_file:
         content = _get_file_from_pmcids(pmcids)
         local_file.write(content.read())
         yield { 'url': url, 'completed': 1, 'total': 1 }
 
+def _remove_files_except(target_directory, filenames):
+    """
+    Deletes files of earlier invocations, so that articles are not
+    listed twice.
+    """
+    for filename in listdir(target_directory):
+        if filename not in filenames:
+            file_path = path.join(target_directory, filename)
+            stderr.write("Removing “%s” … " % file_path)
+            remove(file_path)
+            stderr.write("done.\n")
+
+def _download_metadata_from_history(target_directory, pmcids):
+    webenv, query_key = _post_pmcids(pmcids)
+    if webenv is None or query_key is None:
+        raise RuntimeError, 'PubMed Central IDs could not be posted.'
+
+    batches = OrderedDict()  # filename → first article
+    for retstart in xrange(0, len(pmcids), EFETCH_BATCH_SIZE):
+        batches['efetch-%d.xml' % retstart] = retstart
+
+    _remove_files_except(target_directory, batches)
+
+    url = EUTILS_URL + 'efetch.fcgi'
+    completed = 0
+    yield { 'url': url, 'completed': completed, 'total': len(batches) }
+
+    scheduler = ncbi.get_scheduler()
+    def _download_batch((filename, retstart)):
+        scheduler.fetch_to_file(
+            _get_query_url_from_history(webenv, query_key, retstart,
+                EFETCH_BATCH_SIZE),
+            path.join(target_directory, filename),
+            user_agent=USER_AGENT
+        )
+    pool = ThreadPool(scheduler.concurrency)
+    try:
+        for result in pool.imap_unordered(_download_batch, batches.items()):
+            completed += 1
+            yield { 'url': url, 'completed': completed, 'total': len(batches) }
+    except (HTTPError, URLError) as e:
+        stderr.write('When trying to download from <%s>, the following error occured: “%s”.\n' % \
+            (url, str(e)))
+        exit(255)
+    finally:
+        pool.terminate()
+
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+def _get_article_documents(source, size=BUFSIZE):
+    """
+    Given a file holding an XML document with several articles, yields
+    every <article> element as a document of its own, enclosed in the
+    root element of the given document. The file is read in blocks of
+    size bytes and split without being parsed, so that only the article
+    being split has to be held in memory.
+    """
+    data = ''
+    root = None
+    while True:
+        block = source.read(size)
+        data += block
+        if root is None:
+            root = _ROOT_PATTERN.search(data)
+            if root is None:
+                if not block:
+                    return
+                continue
+            start_tag = root.group(0)
+            end_tag = '</%s>' % root.group(1)
+            data = data[root.end():]
+        end = 0
+        for match in _ARTICLE_PATTERN.finditer(data):
+            yield start_tag + match.group(0) + end_tag
+            end = match.end()
+        if not block:
+            return
+        # keep the start of an article that is not complete yet
+        start = data.find('<article', end)
+        if start == -1:
+            start = max(end, len(data) - len('<article'))
+        data = data[start:]
+
+def list_articles(target_directory, supplementary_materials=False, skip=None,
+    records=None):
+    """
+    Iterates over efetch responses in target_directory, yielding article
+    information. pmc_pmcid lists its responses with this, too.
+
+    skip is a seen-set (see helpers.seen) of article names; names of
+    yielded articles are added to it.
+    """
+    if skip is None:
+        skip = set()
+    if not supplementary_materials:
+        records = None  # stored records include supplementary materials
     listing = listdir(target_directory)
     for filename in listing:
-        result_tree = ElementTree()
-        result_tree.parse(path.join(target_directory, filename))
-        for tree in result_tree.iterfind('article'):
-            pmcid = _get_pmcid(tree)
-            if pmcid in skip:
-                continue
+        if filename.endswith('.part'):  # download in progress
+            continue
+        file_path = path.join(target_directory, filename)
+        mtime = int(path.getmtime(file_path))
+        with open(file_path, 'rb') as f:
+            for i, document in enumerate(_get_article_documents(f)):
+                if records is not None:
+                    try:
+                        result = records.get(filename, str(i), mtime)
+                    except KeyError:  # article was not stored
+                        pass
+                    else:
+                        statistics['records']['replayed'] += 1
+                        if result is not None and result['name'] not in skip:
+                            skip.add(result['name'])
+                            yield result
+                        continue
+                if supplementary_materials and not _is_candidate(document):
+                    if records is not None:
+                        records.put(filename, str(i), mtime, None)
+                        statistics['records']['stored'] += 1
+                    continue
+                parts = _iterparse_articles(StringIO(document)).next()
+                pmcid = _get_pmcid(parts)
+                if pmcid in skip:
+                    continue
+                skip.add(pmcid)
 
-            result = {}
-            result['name'] = pmcid
-            result['doi'] = _get_article_doi(tree)
-            result['article-categories'] = _get_article_categories(tree)
-            result['article-contrib-authors'] = _get_article_contrib_authors(tree)
-            result['article-title'] = _get_article_title(tree)
-            result['article-abstract'] = _get_article_abstract(tree)
-            result['journal-title'] = _get_journal_title(tree)
-            result['article-year'], \
-                result['article-month'], \
-                result['article-day'] = _get_article_date(tree)
-            result['article-url'] = _get_article_url(tree)
-            result['article-license-url'], \
-                result['article-license-text'], \
-                result['article-copyright-statement'] = _get_article_licensing(tree)
-            result['article-copyright-holder'] = _get_article_copyright_holder(tree)
-
-            if supplementary_materials:
-                result['supplementary-materials'] = _get_supplementary_materials(tree)
-            yield result
+                result = {}
+                result['name'] = pmcid
+                result['doi'] = _get_article_doi(parts)
+                result['article-categories'] = _get_article_categories(parts)
+                result['article-contrib-authors'] = _get_article_contrib_authors(parts)
+                result['article-title'] = _get_article_title(parts)
+                result['article-abstract'] = _get_article_abstract(parts)
+                result['journal-title'] = _get_journal_title(parts)
+                result['article-year'], \
+                    result['article-month'], \
+                    result['article-day'] = _get_article_date(parts)
+                result['article-url'] = _get_article_url(parts)
+                result['article-license-url'], \
+                    result['article-license-text'], \
+                    result['article-copyright-statement'] = _get_article_licensing(parts)
+                result['article-copyright-holder'] = _get_article_copyright_holder(parts)
+
+                if supplementary_materials:
+                    result['supplementary-materials'] = _get_supplementary_materials(parts)
+                if records is not None:
+                    records.put(filename, str(i), mtime, result)
+                    statistics['records']['stored'] += 1
+                yield result
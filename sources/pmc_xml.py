@@ -23,12 +23,18 @@ def download_metadata(target_directory):
         yield { 'url': '', 'completed': 1, 'total': 1 }
 
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+def list_articles(target_directory, supplementary_materials=False, skip=None):
+    if skip is None:
+        skip = set()
     result_tree = ElementTree()
     result_tree.parse(path.join(target_directory, 'file.xml'))
     for tree in [result_tree]:
+        name = _get_article_doi(tree)
+        if name in skip:
+            continue
+        skip.add(name)
         result = {}
-        result['name'] = _get_article_doi(tree)
+        result['name'] = name
         result['doi'] = _get_article_doi(tree)
         result['article-contrib-authors'] = _get_article_contrib_authors(tree)
         result['article-title'] = _get_article_title(tree)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from hashlib import sha256
+from os import path, remove, stat
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers.blobs import BlobStore, link_file
+
+CONTENT = 'media' * 1000
+DIGEST = sha256(CONTENT).hexdigest()
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.store = BlobStore(
+            path.join(self.directory, 'blobs'),
+            path.join(self.directory, 'blobs.sqlite')
+        )
+
+    def tearDown(self):
+        self.store.close()
+        rmtree(self.directory)
+
+    def _write(self, name, content=CONTENT):
+        filename = path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(content)
+        return filename
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_add(self):
+        first = self._write('first')
+        self.assertEqual(
+            self.store.add(first, DIGEST, len(CONTENT), 'pmc', u'http://a/1'),
+            ('pmc', u'http://a/1')
+        )
+        self.assertEqual(self.store.get(u'http://a/1'), (DIGEST, len(CONTENT)))
+        self.assertEqual(self.store.get(u'http://a/2'), None)
+        self.assertEqual(self.store.get_first(DIGEST), ('pmc', u'http://a/1'))
+        self.assertEqual(self.store.get_first(sha256('').hexdigest()), None)
+
+    def test_add_duplicate(self):
+        first = self._write('first')
+        self.store.add(first, DIGEST, len(CONTENT), 'pmc', u'http://a/1')
+        second = self._write('second')
+        # the duplicate is replaced by a link to the blob
+        self.assertEqual(
+            self.store.add(second, DIGEST, len(CONTENT), 'pmc_doi', u'http://b/1'),
+            ('pmc', u'http://a/1')
+        )
+        self.assertTrue(path.samefile(first, second))
+        self.assertEqual(self.store.get(u'http://b/1'), (DIGEST, len(CONTENT)))
+
+    def test_link(self):
+        first = self._write('first')
+        self.store.add(first, DIGEST, len(CONTENT), 'pmc', u'http://a/1')
+        remove(first)
+        target = path.join(self.directory, 'target')
+        self.store.link(DIGEST, target)
+        self.assertEqual(self._read(target), CONTENT)
+
+    def test_missing_blob(self):
+        first = self._write('first')
+        self.store.add(first, DIGEST, len(CONTENT), 'pmc', u'http://a/1')
+        remove(path.join(self.directory, 'blobs', DIGEST[:2], DIGEST))
+        self.assertEqual(self.store.get(u'http://a/1'), None)
+
+class LinkFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.source = path.join(self.directory, 'source')
+        self.target = path.join(self.directory, 'target')
+        with open(self.source, 'wb') as f:
+            f.write(CONTENT)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_link_file(self):
+        with open(self.target, 'wb') as f:
+            f.write('old')
+        link_file(self.source, self.target)
+        self.assertTrue(path.samefile(self.source, self.target))
+        self.assertFalse(path.exists(self.target + '.link'))
+
+    def test_link_file_in_place(self):
+        link_file(self.source, self.target)
+        link_file(self.source, self.target)
+        self.assertEqual(stat(self.source).st_nlink, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from helpers import classify
+from helpers.classify import Classifier, get_extension, get_trusted_publishers
+
+class TrustedPublishersTest(unittest.TestCase):
+    def test_trusted(self):
+        materials = \
+            [('10.1371/a%d' % i, 'image/png', 'image/png') for i in xrange(9)] + \
+            [('10.1371/b', 'video/ogg', 'application/ogg')] + \
+            [('10.1186/a%d' % i, 'image/png', 'image/png') for i in xrange(8)] + \
+            [('10.1186/b%d' % i, 'video/mp4', 'image/png') for i in xrange(2)]
+        self.assertEqual(get_trusted_publishers(materials, 10, 0.1),
+            set(['10.1371']))
+        self.assertEqual(get_trusted_publishers(materials, 10, 0.2),
+            set(['10.1371', '10.1186']))
+
+    def test_min_checked(self):
+        materials = [('10.1371/a%d' % i, 'image/png', 'image/png') \
+            for i in xrange(5)]
+        self.assertEqual(get_trusted_publishers(materials, 6, 0), set())
+        self.assertEqual(get_trusted_publishers(materials, 5, 0),
+            set(['10.1371']))
+
+    def test_guessed_office_types(self):
+        # MIME types guessed from extensions are not counted either way
+        materials = [('10.1371/a', 'image/png', 'image/png')] + \
+            [('10.1371/b%d' % i, 'application/msword', 'text/plain') \
+                for i in xrange(5)]
+        self.assertEqual(get_trusted_publishers(materials, 1, 0),
+            set(['10.1371']))
+        self.assertEqual(get_trusted_publishers(materials, 2, 0), set())
+
+class ClassifierTest(unittest.TestCase):
+    def setUp(self):
+        classify.statistics.clear()
+        self.classifier = Classifier(['ogg', 'mp4'], ['png', 'pdf'],
+            ['10.1371'])
+
+    def test_extension(self):
+        self.assertEqual(get_extension('http://example.org/a/B.OGV?x=y.png'),
+            'ogv')
+        self.assertEqual(get_extension('http://example.org/a.b/c'), '')
+
+    def test_reported_media(self):
+        for mimetype, mime_subtype in (('video', 'ogg'), ('audio', 'mpeg'),
+            ('application', 'octet-stream'), ('application', 'ogg')):
+            self.assertTrue(self.classifier.needs_check(mimetype,
+                mime_subtype, 'http://example.org/a.png', '10.1371/a'))
+        self.assertEqual(classify.statistics['classify']['checked'], 4)
+
+    def test_media_extension(self):
+        self.assertTrue(self.classifier.needs_check('image', 'png',
+            'http://example.org/a.MP4', '10.1371/a'))
+
+    def test_non_media_extension(self):
+        self.assertFalse(self.classifier.needs_check('image', 'png',
+            'http://example.org/a.png', '10.1186/a'))
+        self.assertEqual(classify.statistics['classify']['extension'], 1)
+
+    def test_publisher(self):
+        self.assertFalse(self.classifier.needs_check('image', 'jpeg',
+            'http://example.org/a.jpg', '10.1371/a'))
+        self.assertEqual(classify.statistics['classify']['publisher'], 1)
+        self.assertTrue(self.classifier.needs_check('image', 'jpeg',
+            'http://example.org/a.jpg', '10.1186/a'))
+        self.assertTrue(self.classifier.needs_check('image', 'jpeg',
+            'http://example.org/a.jpg', None))
+        self.assertEqual(classify.statistics['classify']['checked'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
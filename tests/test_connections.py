@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Event, Thread
+from urllib2 import HTTPError
+
+import unittest
+
+from helpers import connections
+from helpers.connections import ConnectionPool
+
+CONTENT = 'media' * 1000
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves CONTENT at /media, redirects from /redirect to /media and from
+    /loop to itself and answers 404 for any other path. Every request
+    records its path and the client port of its connection.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address[1],
+            self.headers.getheader('user-agent')))
+        if self.path == '/media':
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(CONTENT)))
+            self.end_headers()
+            self.wfile.write(CONTENT)
+            return
+        if self.path in ('/redirect', '/loop'):
+            self.send_response(302)
+            self.send_header('Location',
+                '/media' if self.path == '/redirect' else '/loop')
+        else:
+            self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True  # connections kept open do not block shutdown
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing connections that were kept open
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.pool = ConnectionPool(1, timeout=5, user_agent='test/1')
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _read(self, url):
+        response = self.pool.open(url)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def test_keep_alive(self):
+        for i in xrange(3):
+            self.assertEqual(self._read(self.base_url + '/media'), CONTENT)
+        ports = set(port for path, port, agent in self.server.requests)
+        self.assertEqual(len(ports), 1)
+        self.assertEqual(self.server.requests[0][2], 'test/1')
+
+    def test_redirect(self):
+        response = self.pool.open(self.base_url + '/redirect')
+        try:
+            self.assertEqual(response.url, self.base_url + '/media')
+            self.assertEqual(response.read(), CONTENT)
+        finally:
+            response.close()
+        # the redirect did not use up the only connection
+        self.assertEqual(
+            [(path, port) for path, port, agent in self.server.requests],
+            [('/redirect', self.server.requests[0][1]),
+                ('/media', self.server.requests[0][1])]
+        )
+
+    def test_too_many_redirects(self):
+        self.assertRaises(HTTPError, self.pool.open, self.base_url + '/loop')
+        self.assertEqual(len(self.server.requests),
+            connections.MAX_REDIRECTS + 1)
+        # connections are released after errors
+        self.assertEqual(self._read(self.base_url + '/media'), CONTENT)
+
+    def test_error(self):
+        try:
+            self.pool.open(self.base_url + '/missing')
+        except HTTPError, e:
+            self.assertEqual(e.code, 404)
+        else:
+            self.fail('HTTPError not raised')
+        self.assertEqual(self._read(self.base_url + '/media'), CONTENT)
+
+    def test_unsupported_scheme(self):
+        self.assertRaises(HTTPError, self.pool.open, 'ftp://127.0.0.1/media')
+
+    def test_per_host(self):
+        first = self.pool.open(self.base_url + '/media')
+        opened = Event()
+        def _open():
+            response = self.pool.open(self.base_url + '/media')
+            opened.set()
+            response.read()
+            response.close()
+        thread = Thread(target=_open)
+        thread.start()
+        # the second request waits for the only connection to the host
+        self.assertFalse(opened.wait(0.2))
+        first.read()
+        first.close()
+        self.assertTrue(opened.wait(5))
+        thread.join()
+
+if __name__ == '__main__':
+    unittest.main()
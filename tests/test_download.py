@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from hashlib import sha256
+from httplib import HTTPException
+from os import path
+from SocketServer import ThreadingMixIn
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+
+import re
+import unittest
+
+from helpers import download
+from helpers.connections import ConnectionPool
+from helpers.download import fetch_media, interleave_by_host
+from helpers.token_bucket import TokenBucket
+
+CONTENT = ''.join(chr(i % 251) for i in xrange(100000))
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves CONTENT, answering range requests as told by the server's
+    mode: 'range', 'ignore-range', 'no-content-range' or 'short'.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.getheader('range'))
+        mode = self.server.mode
+        match = re.match('bytes=(\d+)-(\d*)$', self.headers.getheader('range') or '')
+        if match is None or mode == 'ignore-range':
+            self.send_response(200)
+            body = CONTENT
+            if mode == 'short':
+                self.send_header('Content-Length', str(len(CONTENT)))
+                body = CONTENT[:len(CONTENT) / 2]
+                self.send_header('Connection', 'close')
+        else:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(CONTENT) - 1)
+            if start >= len(CONTENT):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(CONTENT))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            if mode != 'no-content-range':
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % \
+                    (start, end, len(CONTENT)))
+            body = CONTENT[start:end + 1]
+        if mode != 'short':
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True  # connections kept open do not block shutdown
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing connections that were kept open
+
+class FetchMediaTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'media')
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.mode = 'range'
+        self.server.requests = []
+        self.url = 'http://127.0.0.1:%d/media' % self.server.server_port
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.connections = ConnectionPool(1, timeout=5)
+
+    def tearDown(self):
+        self.connections.close()
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.directory)
+
+    def _fetch(self):
+        return fetch_media(self.connections, self.url, self.filename,
+            TokenBucket(0), retries=0)
+
+    def _write(self, filename, content):
+        with open(filename, 'wb') as f:
+            f.write(content)
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def _assertComplete(self, result, downloaded=True):
+        self.assertEqual(
+            result,
+            (downloaded, len(CONTENT), sha256(CONTENT).hexdigest())
+        )
+        self.assertEqual(self._read(self.filename), CONTENT)
+        self.assertFalse(path.exists(self.filename + '.part'))
+
+    def test_download(self):
+        self._assertComplete(self._fetch())
+        self.assertEqual(self.server.requests, [None])
+
+    def test_file_in_place(self):
+        self._write(self.filename, CONTENT)
+        self._assertComplete(self._fetch(), downloaded=False)
+        self.assertEqual(self.server.requests, ['bytes=0-0'])
+
+    def test_resume(self):
+        self._write(self.filename + '.part', CONTENT[:30000])
+        self._assertComplete(self._fetch())
+        self.assertEqual(self.server.requests, ['bytes=30000-'])
+
+    def test_resume_complete(self):
+        self._write(self.filename + '.part', CONTENT)
+        self._assertComplete(self._fetch())
+
+    def test_resume_range_ignored(self):
+        self.server.mode = 'ignore-range'
+        self._write(self.filename + '.part', CONTENT[:30000])
+        self._assertComplete(self._fetch())
+
+    def test_resume_without_content_range(self):
+        self.server.mode = 'no-content-range'
+        self._write(self.filename + '.part', CONTENT[:30000])
+        self.assertRaises(HTTPException, self._fetch)
+        self.assertEqual(self._read(self.filename + '.part'), CONTENT[:30000])
+        self.assertFalse(path.exists(self.filename))
+
+    def test_short_read(self):
+        self.server.mode = 'short'
+        self.assertRaises(HTTPException, self._fetch)
+        self.assertFalse(path.exists(self.filename))
+        # the next attempt continues where this one stopped
+        self.server.mode = 'range'
+        self._assertComplete(self._fetch())
+        self.assertEqual(self.server.requests[-1],
+            'bytes=%d-' % (len(CONTENT) / 2))
+
+class InterleaveByHostTest(unittest.TestCase):
+    def test_interleave(self):
+        self.assertEqual(
+            interleave_by_host([
+                'http://a/1', 'http://a/2', 'http://a/3',
+                'http://B/1', 'http://c/1', 'http://b/2'
+            ]),
+            [
+                'http://a/1', 'http://B/1', 'http://c/1',
+                'http://a/2', 'http://b/2', 'http://a/3'
+            ]
+        )
+
+    def test_empty(self):
+        self.assertEqual(interleave_by_host([]), [])
+
+if __name__ == '__main__':
+    unittest.main()
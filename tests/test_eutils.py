@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers import eutils
+from helpers.eutils import ResponseCache
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.now = 1000000.0
+        self.time = eutils.time
+        eutils.time = lambda: self.now
+        self.cache = ResponseCache(
+            path.join(self.directory, 'eutils.sqlite'),
+            100
+        )
+
+    def tearDown(self):
+        self.cache.db.close()
+        eutils.time = self.time
+        rmtree(self.directory)
+
+    def test_get(self):
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), None)
+        self.cache.put('efetch?id=1', 'efetch', '<a/>')
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), '<a/>')
+        self.cache.put('efetch?id=1', 'efetch', '<b/>')
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), '<b/>')
+
+    def test_ttl(self):
+        self.cache.put('esearch?term=a', 'esearch', '<a/>')
+        self.cache.put('efetch?id=1', 'efetch', '<b/>')
+        self.cache.put('elink?id=1', 'elink', '<c/>')
+        self.now += eutils.TTLS['esearch']
+        self.assertEqual(self.cache.get('esearch?term=a', 'esearch'), '<a/>')
+        self.assertEqual(self.cache.get('elink?id=1', 'elink'), '<c/>')
+        self.now += 1
+        self.assertEqual(self.cache.get('esearch?term=a', 'esearch'), None)
+        self.assertEqual(self.cache.get('elink?id=1', 'elink'), None)
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), '<b/>')
+        self.now += eutils.TTLS['efetch']
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), None)
+
+    def test_eviction(self):
+        for i in xrange(4):
+            self.cache.put('efetch?id=%d' % i, 'efetch', str(i) * 30)
+            self.now += 1
+        # the oldest response was removed to stay within 100 bytes
+        self.assertEqual(self.cache.get('efetch?id=0', 'efetch'), None)
+        # reading a response makes it the most recently used one
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), '1' * 30)
+        self.now += 1
+        self.cache.put('efetch?id=4', 'efetch', '4' * 30)
+        self.assertEqual(self.cache.get('efetch?id=2', 'efetch'), None)
+        for i in (1, 3, 4):
+            self.assertEqual(
+                self.cache.get('efetch?id=%d' % i, 'efetch'),
+                str(i) * 30
+            )
+
+    def test_oversized(self):
+        self.cache.put('efetch?id=1', 'efetch', '1' * 30)
+        self.cache.put('efetch?id=2', 'efetch', '2' * 101)
+        self.assertEqual(self.cache.get('efetch?id=2', 'efetch'), None)
+        # the cache was not emptied to make room for it
+        self.assertEqual(self.cache.get('efetch?id=1', 'efetch'), '1' * 30)
+
+    def test_size(self):
+        self.cache.put('efetch?id=1', 'efetch', '1' * 30)
+        self.cache.put('efetch?id=1', 'efetch', '1' * 20)
+        self.cache.put('efetch?id=2', 'efetch', '2' * 30)
+        self.assertEqual(self.cache.get_size(), 50)
+        self.cache.db.close()
+        self.cache = ResponseCache(
+            path.join(self.directory, 'eutils.sqlite'),
+            100
+        )
+        self.assertEqual(self.cache.get_size(), 50)
+
+    def test_shared_eviction(self):
+        other = ResponseCache(path.join(self.directory, 'eutils.sqlite'), 100)
+        try:
+            for i in xrange(3):
+                other.put('efetch?id=%d' % i, 'efetch', str(i) * 30)
+                self.now += 1
+        finally:
+            other.db.close()
+        # responses stored by another process count, too
+        self.cache.put('efetch?id=3', 'efetch', '3' * 30)
+        self.assertEqual(self.cache.get('efetch?id=0', 'efetch'), None)
+        self.assertEqual(self.cache.get_size(), 90)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers.harvest import HarvestState
+
+URL = 'http://www.pubmedcentral.nih.gov/utils/oa/oa.fcgi?from=2012-07-01&until=2012-07-02'
+
+class HarvestStateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'state.sqlite')
+        self.state = HarvestState(self.filename)
+        self.state.add_partition('2012-07-01', '2012-07-02', URL)
+
+    def tearDown(self):
+        self.state.close()
+        rmtree(self.directory)
+
+    def test_pages(self):
+        self.assertEqual(self.state.get_url('2012-07-01', '2012-07-02'), URL)
+        self.state.put_page('2012-07-01', '2012-07-02', ['PMC3', 'PMC1'],
+            URL + '&resumptionToken=1')
+        self.state.put_page('2012-07-01', '2012-07-02', ['PMC2', 'PMC1'], None)
+        self.assertEqual(self.state.get_url('2012-07-01', '2012-07-02'), None)
+        self.assertEqual(
+            self.state.get_ids('2012-07-01', '2012-07-02'),
+            ['PMC3', 'PMC1', 'PMC2']
+        )
+
+    def test_resume(self):
+        self.state.put_page('2012-07-01', '2012-07-02', ['PMC3'],
+            URL + '&resumptionToken=1')
+        self.state.close()
+        self.state = HarvestState(self.filename)
+        # an existing partition keeps its progress
+        self.state.add_partition('2012-07-01', '2012-07-02', URL)
+        self.assertEqual(
+            self.state.get_url('2012-07-01', '2012-07-02'),
+            URL + '&resumptionToken=1'
+        )
+        self.assertEqual(self.state.get_ids('2012-07-01', '2012-07-02'),
+            ['PMC3'])
+
+    def test_remove_partition(self):
+        self.state.put_page('2012-07-01', '2012-07-02', ['PMC3'], None)
+        self.state.remove_partition('2012-07-01', '2012-07-02')
+        self.state.add_partition('2012-07-01', '2012-07-02', URL)
+        self.assertEqual(self.state.get_url('2012-07-01', '2012-07-02'), URL)
+        self.assertEqual(self.state.get_ids('2012-07-01', '2012-07-02'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers import import_queue
+from helpers.import_queue import ImportQueue
+
+class ImportQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'queue.sqlite')
+        self.now = 1000000.0
+        self.time = import_queue.time
+        import_queue.time = lambda: self.now
+        self.queue = ImportQueue(self.filename, 3, 600)
+
+    def tearDown(self):
+        self.queue.close()
+        import_queue.time = self.time
+        rmtree(self.directory)
+
+    def test_take(self):
+        self.queue.add(['PMC1', 'PMC2', 'PMC3'])
+        self.queue.add(['PMC2'])  # queued already
+        self.assertEqual(self.queue.take(2), ['PMC1', 'PMC2'])
+        self.assertEqual(self.queue.take(5), ['PMC1', 'PMC2', 'PMC3'])
+        self.queue.done(['PMC1', 'PMC2'])
+        self.assertEqual(self.queue.take(5), ['PMC3'])
+
+    def test_retry(self):
+        self.queue.add(['PMC1', 'PMC2', 'PMC3'])
+        # IDs that failed in a batch are retried later, each on its own
+        self.assertEqual(self.queue.fail(['PMC1', 'PMC2'], 'error'), [])
+        self.assertEqual(self.queue.take(5), ['PMC3'])
+        self.assertEqual(self.queue.get_next_due(), self.now)
+        self.queue.done(['PMC3'])
+        self.assertEqual(self.queue.get_next_due(), self.now + 600)
+        self.now += 600
+        self.assertEqual(self.queue.take(5), ['PMC1'])
+        self.queue.done(['PMC1'])
+        self.assertEqual(self.queue.take(5), ['PMC2'])
+
+    def test_delay_doubles(self):
+        self.queue.add(['PMC1'])
+        self.queue.fail(['PMC1'], 'error')
+        self.now += 599
+        self.assertEqual(self.queue.take(5), [])
+        self.now += 1
+        self.assertEqual(self.queue.take(5), ['PMC1'])
+        self.queue.fail(['PMC1'], 'error')
+        self.assertEqual(self.queue.get_next_due(), self.now + 1200)
+
+    def test_give_up(self):
+        self.queue.add(['PMC1', 'PMC2'])
+        for i in xrange(3):
+            self.queue.fail(['PMC1', 'PMC2'], 'error in batch')
+            self.now += 600 * 2 ** i
+        # failing in a batch does not count as the last attempt
+        self.assertEqual(self.queue.take(5), ['PMC1'])
+        self.assertEqual(self.queue.fail(['PMC1'], 'error'), ['PMC1'])
+        self.assertEqual(self.queue.get_failed(), [(u'PMC1', u'error')])
+        self.assertEqual(self.queue.take(5), ['PMC2'])
+        self.queue.done(['PMC2'])
+        self.assertEqual(self.queue.take(5), [])
+        self.assertEqual(self.queue.get_next_due(), None)
+
+    def test_reopen(self):
+        self.queue.add(['PMC1', 'PMC2'])
+        self.queue.fail(['PMC1'], 'error')
+        self.queue.close()
+        self.queue = ImportQueue(self.filename, 3, 600)
+        self.assertEqual(self.queue.take(5), ['PMC2'])
+        self.now += 600
+        self.assertEqual(self.queue.take(5), ['PMC1'])
+
+if __name__ == '__main__':
+    unittest.main()
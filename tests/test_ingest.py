@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import sqlite3
+import unittest
+
+from sys import stderr
+
+from helpers import config
+from model import metadata, session, setup_all
+import ingest
+
+def _get_result(number, doi, categories, urls, **kwargs):
+    """
+    Returns article information as yielded by sources.
+    """
+    result = {
+        'name': 'J/article-%d.nxml' % number,
+        'doi': doi,
+        'article-title': u'Article %d' % number,
+        'article-contrib-authors': u'Author %d' % number,
+        'article-abstract': u'Abstract',
+        'journal-title': u'Journal %d' % (number % 2),
+        'article-year': 2012,
+        'article-month': 7,
+        'article-day': None,
+        'article-url': None,
+        'article-license-url': u'http://creativecommons.org/licenses/by/3.0/',
+        'article-license-text': None,
+        'article-copyright-statement': None,
+        'article-copyright-holder': None,
+        'article-categories': categories,
+        'supplementary-materials': [{
+            'label': u'Video %d' % i,
+            'title': u'',
+            'caption': u'',
+            'mimetype': u'video',
+            'mime-subtype': u'mp4',
+            'url': url
+        } for i, url in enumerate(urls)]
+    }
+    result.update(kwargs)
+    return result
+
+RESULTS = [
+    _get_result(1, u'10.1371/1', [u'Cell Biology'], [u'http://a/1']),
+    _get_result(2, u'10.1371/2', [u'Cell Biology', u'Gene Expression'],
+        [u'http://a/2', u'http://a/3']),
+    _get_result(3, u'10.1371/3', [], []),  # no media
+    _get_result(4, None, [u'Neural Networks'], [u'http://a/4']),  # no DOI
+    _get_result(5, u'10.5555/5', [], [u'http://a/5']),  # not whitelisted
+    # article seen before, now without DOI: categories and media are added
+    _get_result(1, None, [u'Cell Biology', u'Molecular Evolution'],
+        [u'http://a/1', u'http://a/6']),
+    # article seen before, with the same URL given for another material
+    _get_result(2, u'10.1371/2', [u'Gene Expression'], [u'http://a/3'],
+        name='J/article-2-again.nxml'),
+    _get_result(6, u'10.1371/6', [u'Gene Expression'], [u'http://a/7']),
+    # not whitelisted, seen in the same batch
+    _get_result(6, u'10.5555/6', [u'Animal Behavior'], [u'http://a/8']),
+]
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.whitelist_doi = config.whitelist_doi
+        config.whitelist_doi = ['10.1371']
+        ingest.stderr = StringIO()  # messages about skipped articles
+
+    def tearDown(self):
+        config.whitelist_doi = self.whitelist_doi
+        ingest.stderr = stderr
+        session.close()
+        rmtree(self.directory)
+
+    def _ingest(self, ingester_class, *args):
+        """
+        Adds RESULTS to a new database, returning its file name and
+        which results were added.
+        """
+        filename = path.join(self.directory, '%s.sqlite' % \
+            ingester_class.__name__)
+        session.close()
+        metadata.bind = 'sqlite:///%s' % filename
+        setup_all(True)
+        ingester = ingester_class(*args)
+        added = [ingester.add(result) for result in RESULTS]
+        ingester.flush()
+        session.close()
+        metadata.bind.dispose()
+        return filename, added
+
+    def _dump(self, filename):
+        db = sqlite3.connect(filename)
+        try:
+            return dict(
+                (table, sorted(db.execute('SELECT * FROM %s' % table)))
+                    for table, in db.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    )
+            )
+        finally:
+            db.close()
+
+    def test_bulk_is_orm(self):
+        orm_filename, orm_added = self._ingest(ingest.OrmIngest)
+        bulk_filename, bulk_added = self._ingest(ingest.BulkIngest, 2)
+        self.assertEqual(orm_added, bulk_added)
+        self.assertEqual(
+            orm_added,
+            [True, True, True, False, False, True, True, True, True]
+        )
+        self.assertEqual(self._dump(orm_filename), self._dump(bulk_filename))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers.ledger import Ledger, IMPORTED, FAILED
+
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'ledger.sqlite')
+        self.ledger = Ledger(self.filename)
+
+    def tearDown(self):
+        self.ledger.close()
+        rmtree(self.directory)
+
+    def test_imported(self):
+        self.ledger.record(['PMC1', 'PMC2'], IMPORTED)
+        self.ledger.record(['PMC3'], FAILED)
+        self.assertEqual(
+            self.ledger.get_imported(['PMC1', 'PMC3', 'PMC4']),
+            set(['PMC1'])
+        )
+
+    def test_outcome_replaced(self):
+        self.ledger.record(['PMC1', 'PMC2'], FAILED)
+        self.ledger.record(['PMC1'], IMPORTED)
+        self.ledger.record(['PMC2'], IMPORTED)
+        self.ledger.record(['PMC2'], FAILED)
+        self.assertEqual(self.ledger.get_imported(['PMC1', 'PMC2']),
+            set(['PMC1']))
+
+    def test_watermarks(self):
+        self.assertEqual(self.ledger.get_watermark('oa-pmc-ids-until'), None)
+        self.ledger.set_watermark('oa-pmc-ids-until', '2012-07-01')
+        self.ledger.set_watermark('other', '1')
+        self.ledger.set_watermark('oa-pmc-ids-until', '2012-07-02')
+        self.assertEqual(self.ledger.get_watermark('oa-pmc-ids-until'),
+            '2012-07-02')
+        self.assertEqual(self.ledger.get_watermark('other'), '1')
+
+    def test_reopen(self):
+        self.ledger.record(['PMC1'], IMPORTED)
+        self.ledger.set_watermark('oa-pmc-ids-until', '2012-07-01')
+        self.ledger.close()
+        self.ledger = Ledger(self.filename)
+        self.assertEqual(self.ledger.get_imported(['PMC1']), set(['PMC1']))
+        self.assertEqual(self.ledger.get_watermark('oa-pmc-ids-until'),
+            '2012-07-01')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from urllib2 import HTTPError, URLError
+
+import unittest
+
+from helpers import ncbi, token_bucket
+from helpers.ncbi import Scheduler
+
+URL = 'http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pmc&id=1'
+
+class _Random(object):
+    """
+    Stands in for the random module, always choosing the longest delay.
+    """
+    def uniform(self, a, b):
+        return b
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.responses = []  # bodies or errors, in the order of requests
+        self.requests = []
+        self.waited = []
+        self.urlopen = ncbi.urlopen
+        self.sleep = ncbi.sleep
+        self.random = ncbi.random
+        self.bucket_sleep = token_bucket.sleep
+        ncbi.urlopen = self._urlopen
+        ncbi.sleep = self.waited.append
+        ncbi.random = _Random()
+        token_bucket.sleep = lambda seconds: None
+
+    def tearDown(self):
+        ncbi.urlopen = self.urlopen
+        ncbi.sleep = self.sleep
+        ncbi.random = self.random
+        token_bucket.sleep = self.bucket_sleep
+
+    def _urlopen(self, request, timeout=None):
+        self.requests.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return StringIO(response)
+
+    def _http_error(self, code, headers={}):
+        return HTTPError(URL, code, 'Error', headers, None)
+
+    def test_fetch(self):
+        self.responses = ['<a/>']
+        self.assertEqual(Scheduler().fetch(URL, user_agent='test/1'), '<a/>')
+        self.assertEqual(self.requests[0].get_full_url(), URL)
+        self.assertEqual(self.requests[0].get_header('User-agent'), 'test/1')
+        self.assertEqual(self.waited, [])
+
+    def test_api_key(self):
+        self.responses = ['<a/>', '<b/>']
+        scheduler = Scheduler('key')
+        self.assertEqual(scheduler.bucket.rate, ncbi.RATE_WITH_API_KEY)
+        scheduler.fetch(URL)
+        scheduler.fetch('http://www.pubmedcentral.nih.gov/utils/oa/oa.fcgi')
+        self.assertEqual(self.requests[0].get_full_url(), URL + '&api_key=key')
+        # the key is only sent to E-utilities
+        self.assertEqual(self.requests[1].get_full_url(),
+            'http://www.pubmedcentral.nih.gov/utils/oa/oa.fcgi')
+
+    def test_backoff(self):
+        self.responses = [
+            self._http_error(503),
+            URLError('timed out'),
+            self._http_error(429),
+            '<a/>'
+        ]
+        errors = []
+        self.assertEqual(
+            Scheduler().fetch(URL, on_error=errors.append),
+            '<a/>'
+        )
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.waited, [1, 2, 4])
+
+    def test_max_backoff(self):
+        self.responses = [self._http_error(500)] * ncbi.RETRIES + ['<a/>']
+        Scheduler().fetch(URL)
+        self.assertEqual(max(self.waited), ncbi.MAX_BACKOFF)
+
+    def test_retry_after(self):
+        self.responses = [
+            self._http_error(429, {'Retry-After': '30'}),
+            self._http_error(429, {'Retry-After': 'soon'}),
+            '<a/>'
+        ]
+        Scheduler().fetch(URL)
+        self.assertEqual(self.waited, [30.0, 2])
+
+    def test_give_up(self):
+        error = self._http_error(503)
+        self.responses = [error] * (ncbi.RETRIES + 1)
+        self.assertRaises(HTTPError, Scheduler().fetch, URL)
+        self.assertEqual(len(self.waited), ncbi.RETRIES)
+
+    def test_permanent_error(self):
+        self.responses = [self._http_error(404), '<a/>']
+        self.assertRaises(HTTPError, Scheduler().fetch, URL)
+        self.assertEqual(self.waited, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from os import path
+from shutil import rmtree
+from sys import stderr
+from tempfile import mkdtemp
+
+import tarfile
+import unittest
+import zlib
+
+from helpers import download
+from helpers.records import NoMediaStore
+from sources import pmc
+from sources.pmc import _LicenseTable
+
+TABLE = {
+    'This is an open-access article distributed under the terms of the Creative Commons Attribution License.':
+        u'http://creativecommons.org/licenses/by/4.0/',
+    'Distributed under the   terms of the\nCreative Commons Attribution License.':
+        u'http://creativecommons.org/licenses/by/3.0/',
+    'This work is in the public domain.':
+        u'http://creativecommons.org/publicdomain/zero/1.0/',
+}
+
+class LicenseTableTest(unittest.TestCase):
+    def setUp(self):
+        pmc.statistics.clear()
+
+    def test_exact(self):
+        table = _LicenseTable('test', TABLE)
+        self.assertEqual(
+            table[u'This work is in the public domain.'],
+            u'http://creativecommons.org/publicdomain/zero/1.0/'
+        )
+        # statements in the table are normalised
+        self.assertEqual(
+            table[u'Distributed under the terms of the Creative Commons Attribution License.'],
+            u'http://creativecommons.org/licenses/by/3.0/'
+        )
+        self.assertRaises(KeyError, table.__getitem__,
+            u'© 2012 Someone. This work is in the public domain.')
+        self.assertEqual(pmc.statistics['test'], {'hits': 2, 'misses': 1})
+
+    def test_suffixes(self):
+        table = _LicenseTable('test', TABLE, suffixes=True)
+        self.assertEqual(
+            table[u'© 2012 Someone. This work is in the public domain.'],
+            u'http://creativecommons.org/publicdomain/zero/1.0/'
+        )
+        # the longest statement the text ends with is matched
+        self.assertEqual(
+            table[u'© 2012 Someone. This is an open-access article distributed under the terms of the Creative Commons Attribution License.'],
+            u'http://creativecommons.org/licenses/by/4.0/'
+        )
+        self.assertEqual(
+            table[u'Open access. Distributed under the terms of the Creative Commons Attribution License.'],
+            u'http://creativecommons.org/licenses/by/3.0/'
+        )
+        self.assertRaises(KeyError, table.__getitem__,
+            u'This work is in the public domain. © 2012 Someone.')
+        self.assertRaises(KeyError, table.__getitem__, u'domain.')
+        self.assertEqual(pmc.statistics['test'], {'hits': 3, 'misses': 2})
+
+class ArchiveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.archive_path = path.join(self.directory, 'articles.A-B.tar.gz')
+        pmc.stderr = StringIO()  # messages about indexing
+        pmc.statistics.clear()
+        self.contents = {}
+        with tarfile.open(self.archive_path, 'w:gz') as archive:
+            for i in xrange(50):
+                name = 'J/article-%d.nxml' % i
+                content = '<article>%s</article>' % ('%d ' % i * (i * 100))
+                self._add(archive, name, content)
+            self._add(archive, 'J/article-0.pdf', '%PDF')
+
+    def tearDown(self):
+        pmc.stderr = stderr
+        rmtree(self.directory)
+
+    def _add(self, archive, name, content):
+        item = tarfile.TarInfo(name)
+        item.size = len(content)
+        item.mtime = 1341100800
+        archive.addfile(item, StringIO(content))
+        self.contents[name] = content
+
+    def test_index(self):
+        points, files = pmc._get_index(self.archive_path)
+        self.assertTrue(path.exists(self.archive_path + '.index'))
+        self.assertEqual(
+            sorted(member[0] for member in files),
+            sorted(self.contents)
+        )
+        self.assertEqual(pmc._get_index(self.archive_path), (points, files))
+
+    def test_restart_points(self):
+        member_size = pmc.MEMBER_SIZE
+        pmc.MEMBER_SIZE = 4096
+        try:
+            points, files = pmc._get_index(self.archive_path)
+        finally:
+            pmc.MEMBER_SIZE = member_size
+        self.assertTrue(len(points) > 10)
+        self.assertEqual(points[0], (0, 0))
+        # decompression can start at every restart point
+        with open(self.archive_path, 'rb') as f:
+            for start, offset in points[1:]:
+                f.seek(offset)
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.assertEqual(len(decompressor.decompress(f.read(4096))),
+                    4096)
+
+    def test_stale_index(self):
+        with open(self.archive_path + '.index', 'w') as index_file:
+            index_file.write('1\t1\nJ/article-99.nxml\t0\t512\t1\t1\n')
+        self.assertEqual(len(pmc._get_index(self.archive_path)[1]), 51)
+
+    def test_is_downloaded(self):
+        size = path.getsize(self.archive_path)
+        md5 = download.get_local_md5(self.archive_path)
+        self.assertTrue(pmc._is_downloaded(self.archive_path, size, md5))
+        pmc._get_index(self.archive_path)  # recompresses the archive
+        self.assertTrue(pmc._is_downloaded(self.archive_path, size, md5))
+        self.assertTrue(pmc._is_downloaded(self.archive_path, size, None))
+        self.assertFalse(pmc._is_downloaded(self.archive_path, size, '0' * 32))
+        self.assertFalse(pmc._is_downloaded(self.archive_path, size + 1, md5))
+        self.assertFalse(pmc._is_downloaded(self.archive_path + '.x', size,
+            md5))
+
+    def test_wanted_members(self):
+        skip = set(['J/article-1.nxml'])
+        points, members = pmc._get_wanted_members(self.archive_path, skip)
+        self.assertEqual(len(members), 49)
+        self.assertFalse('J/article-1.nxml' in [m[0] for m in members])
+        self.assertEqual(len(skip), 50)
+
+    def test_read_members(self):
+        member_size = pmc.MEMBER_SIZE
+        pmc.MEMBER_SIZE = 4096
+        try:
+            points, files = pmc._get_index(self.archive_path)
+        finally:
+            pmc.MEMBER_SIZE = member_size
+        for members in (files, files[:1], files[-1:], files[3:40:7],
+            files[40:41] + files[45:]):
+            self.assertEqual(
+                list(pmc._read_members(self.archive_path, points, members)),
+                [(m[0], self.contents[m[0]]) for m in members]
+            )
+
+    def test_no_media(self):
+        store = NoMediaStore(path.join(self.directory, 'no-media.sqlite'))
+        try:
+            # none of the articles has media
+            self.assertEqual(list(pmc.list_articles(self.directory, True,
+                set(), processes=1, no_media=store)), [])
+            self.assertEqual(pmc.statistics['no-media']['stored'], 50)
+            self.assertEqual(list(pmc.list_articles(self.directory, True,
+                set(), processes=1, no_media=store)), [])
+            self.assertEqual(pmc.statistics['no-media']['skipped'], 50)
+        finally:
+            store.close()
+
+    def test_truncated(self):
+        points, files = pmc._get_index(self.archive_path)
+        with open(self.archive_path, 'rb') as f:
+            data = f.read()
+        with open(self.archive_path, 'wb') as f:
+            f.write(data[:len(data) / 2])
+        self.assertRaises((EOFError, IOError), list,
+            pmc._read_members(self.archive_path, points, files[-1:]))
+
+if __name__ == '__main__':
+    unittest.main()
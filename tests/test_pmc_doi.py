@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from os import listdir, path
+from shutil import rmtree
+from sys import stderr, stdin
+from tempfile import mkdtemp
+from threading import Lock
+from urllib2 import urlparse
+
+import unittest
+
+from helpers import ncbi
+from sources import pmc_doi
+
+DOIS = ['10.1371/journal.pone.%07d' % i for i in xrange(250)]
+
+class _Scheduler(object):
+    """
+    Stands in for the NCBI scheduler, recording the URLs it fetches.
+    """
+    concurrency = 2
+
+    def __init__(self):
+        self.lock = Lock()
+        self.urls = []
+
+    def fetch_to_file(self, url, filename, data=None, user_agent=None):
+        with self.lock:
+            self.urls.append(url)
+        with open(filename, 'w') as f:
+            f.write('<pmc-articleset/>')
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.posts = []
+        self.urls = []
+        self.scheduler = _Scheduler()
+        self.saved = dict((name, getattr(pmc_doi, name)) for name in (
+            '_get_file_from_post', '_get_file_from_url', 'DOI_BATCH_SIZE',
+            'EFETCH_BATCH_SIZE', 'stdin', 'stderr'
+        ))
+        pmc_doi._get_file_from_post = self._get_file_from_post
+        pmc_doi._get_file_from_url = self._get_file_from_url
+        pmc_doi.DOI_BATCH_SIZE = 100
+        pmc_doi.EFETCH_BATCH_SIZE = 100
+        pmc_doi.stdin = StringIO(' '.join(DOIS))
+        pmc_doi.stderr = StringIO()
+        ncbi._scheduler = self.scheduler
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(pmc_doi, name, value)
+        ncbi._scheduler = None
+        rmtree(self.directory)
+
+    def _get_file_from_post(self, endpoint, parameters):
+        self.posts.append((endpoint, parameters))
+        if endpoint == 'esearch.fcgi':
+            # one PMCID for every DOI
+            dois = parameters['term'].split(' OR ')
+            return StringIO('<eSearchResult><IdList>%s</IdList></eSearchResult>' % \
+                ''.join('<Id>%s</Id>' % doi.split('.')[-1][:-len('[doi]')] \
+                    for doi in dois))
+        if endpoint == 'epost.fcgi':
+            return StringIO('<ePostResult><QueryKey>1</QueryKey>' + \
+                '<WebEnv>NCID_1</WebEnv></ePostResult>')
+
+    def _get_file_from_url(self, url):
+        self.urls.append(url)
+        return StringIO('<eSearchResult><IdList><Id>1</Id></IdList></eSearchResult>')
+
+    def test_few_dois(self):
+        self.assertEqual(pmc_doi._get_pmcids_from_dois(DOIS[:3]), ['1'])
+        self.assertEqual(self.posts, [])
+        self.assertTrue('%20OR%20' in self.urls[0])
+
+    def test_dois_in_batches(self):
+        pmcids = pmc_doi._get_pmcids_from_dois(DOIS)
+        self.assertEqual(len(pmcids), len(DOIS))
+        self.assertEqual([endpoint for endpoint, parameters in self.posts],
+            ['esearch.fcgi'] * 3)
+        self.assertEqual(self.posts[2][1]['retmax'], 100)
+        self.assertEqual(self.urls, [])
+
+    def test_download_metadata(self):
+        with open(path.join(self.directory, 'efetch-0.xml.part'), 'w') as f:
+            f.write('<pmc-articleset>')
+        progress = list(pmc_doi.download_metadata(self.directory))
+        self.assertEqual(self.posts[-1],
+            ('epost.fcgi', {'db': 'pmc', 'id': ','.join(
+                '%07d' % i for i in xrange(250))}))
+        self.assertEqual(
+            sorted(listdir(self.directory)),
+            ['efetch-0.xml', 'efetch-100.xml', 'efetch-200.xml']
+        )
+        queries = sorted(
+            [dict(urlparse.parse_qsl(urlparse.urlsplit(url).query)) \
+                for url in self.scheduler.urls],
+            key=lambda query: int(query['retstart'])
+        )
+        self.assertEqual(
+            [(q['WebEnv'], q['query_key'], q['retstart'], q['retmax']) \
+                for q in queries],
+            [('NCID_1', '1', str(retstart), '100') for retstart in (0, 100, 200)]
+        )
+        self.assertEqual(progress[-1]['completed'], 3)
+        self.assertEqual(progress[-1]['total'], 3)
+
+ARTICLES = [
+    '<article article-type="research-article"><front><article-meta>' + \
+        '<article-id pub-id-type="pmc">%d</article-id></article-meta>' % i + \
+        '</front><body>%s</body></article>' % ('text ' * i) \
+            for i in xrange(20)
+]
+DOCUMENT = '<?xml version="1.0"?>\n<!DOCTYPE pmc-articleset>\n' + \
+    '<pmc-articleset xmlns:xlink="http://www.w3.org/1999/xlink">\n' + \
+    '\n'.join(ARTICLES) + '\n</pmc-articleset>\n'
+
+class ArticleDocumentsTest(unittest.TestCase):
+    def _get_documents(self, document, size):
+        return list(pmc_doi._get_article_documents(StringIO(document), size))
+
+    def test_documents(self):
+        start_tag = '<pmc-articleset xmlns:xlink="http://www.w3.org/1999/xlink">'
+        self.assertEqual(
+            self._get_documents(DOCUMENT, len(DOCUMENT)),
+            [start_tag + article + '</pmc-articleset>' for article in ARTICLES]
+        )
+
+    def test_block_boundaries(self):
+        # articles, start tags and the root element are split across blocks
+        expected = self._get_documents(DOCUMENT, len(DOCUMENT))
+        for size in (1, 7, 8, 9, 50, 64, 100, 1000):
+            self.assertEqual(self._get_documents(DOCUMENT, size), expected)
+
+    def test_similar_tags(self):
+        # <article-meta> and <article-id> do not start articles
+        document = '<pmc-articleset><article-meta/>' + ARTICLES[1] + \
+            '</pmc-articleset>'
+        for size in (1, 5, len(document)):
+            self.assertEqual(
+                self._get_documents(document, size),
+                ['<pmc-articleset>' + ARTICLES[1] + '</pmc-articleset>']
+            )
+
+    def test_empty(self):
+        self.assertEqual(self._get_documents('', 10), [])
+        self.assertEqual(
+            self._get_documents('<pmc-articleset></pmc-articleset>', 10),
+            []
+        )
+
+if __name__ == '__main__':
+    unittest.main()
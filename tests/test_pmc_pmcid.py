@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+from hashlib import md5
+from os import listdir, path
+from shutil import rmtree
+from sys import stderr, stdin
+from tempfile import mkdtemp
+from threading import Lock
+
+import unittest
+
+from helpers import eutils
+from sources import pmc_pmcid
+
+PMCIDS = ['PMC%d' % i for i in xrange(400)]
+
+def _get_chunk_filename(pmcids):
+    return 'efetch-%s.xml' % md5(' '.join(pmcids)).hexdigest()
+
+class DownloadMetadataTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.fetched = []
+        self.lock = Lock()
+        self.fetch_to_file = eutils.fetch_to_file
+        eutils.fetch_to_file = self._fetch_to_file
+        pmc_pmcid.stdin = StringIO(' '.join(PMCIDS))
+        pmc_pmcid.stderr = StringIO()
+
+    def tearDown(self):
+        eutils.fetch_to_file = self.fetch_to_file
+        pmc_pmcid.stdin = stdin
+        pmc_pmcid.stderr = stderr
+        rmtree(self.directory)
+
+    def _fetch_to_file(self, url, filename, user_agent):
+        with self.lock:
+            self.fetched.append(url)
+        with open(filename, 'w') as f:
+            f.write('<pmc-articleset/>')
+
+    def _write(self, filename):
+        with open(path.join(self.directory, filename), 'w') as f:
+            f.write('<pmc-articleset/>')
+
+    def test_chunks(self):
+        progress = list(pmc_pmcid.download_metadata(self.directory))
+        self.assertEqual(
+            sorted(listdir(self.directory)),
+            sorted([
+                _get_chunk_filename(PMCIDS[:365]),
+                _get_chunk_filename(PMCIDS[365:])
+            ])
+        )
+        self.assertEqual(sorted(self.fetched), sorted([
+            pmc_pmcid._get_query_url_from_pmcids(PMCIDS[:365]),
+            pmc_pmcid._get_query_url_from_pmcids(PMCIDS[365:])
+        ]))
+        self.assertEqual(
+            [(p['completed'], p['total']) for p in progress],
+            [(0, 2), (1, 2), (2, 2)]
+        )
+
+    def test_resume(self):
+        # a chunk completed by an interrupted invocation is kept
+        self._write(_get_chunk_filename(PMCIDS[:365]))
+        # files of other input and partial files are removed
+        self._write(_get_chunk_filename(PMCIDS[:10]))
+        self._write(_get_chunk_filename(PMCIDS[365:]) + '.part')
+        progress = list(pmc_pmcid.download_metadata(self.directory))
+        self.assertEqual(self.fetched, [
+            pmc_pmcid._get_query_url_from_pmcids(PMCIDS[365:])
+        ])
+        self.assertEqual(
+            sorted(listdir(self.directory)),
+            sorted([
+                _get_chunk_filename(PMCIDS[:365]),
+                _get_chunk_filename(PMCIDS[365:])
+            ])
+        )
+        self.assertEqual(
+            [(p['completed'], p['total']) for p in progress],
+            [(1, 2), (2, 2)]
+        )
+
+    def test_no_input(self):
+        pmc_pmcid.stdin = StringIO('')
+        self.assertRaises(RuntimeError, list,
+            pmc_pmcid.download_metadata(self.directory))
+
+if __name__ == '__main__':
+    unittest.main()
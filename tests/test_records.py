@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers import records
+from helpers.records import NoMediaStore, RecordStore
+
+RECORD = {
+    'name': 'J/article-1.nxml',
+    'article-title': u'Über Artikel',
+    'article-year': 2012,
+    'article-categories': [u'Cell Biology'],
+    'supplementary-materials': [{'label': u'Video 1', 'url': u'http://a/1'}]
+}
+
+class RecordStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'records.sqlite')
+        self.store = RecordStore(self.filename)
+
+    def tearDown(self):
+        self.store.close()
+        rmtree(self.directory)
+
+    def test_get(self):
+        self.store.put('a.tar.gz', 'J/article-1.nxml', 100, RECORD)
+        self.store.put('a.tar.gz', 'J/article-2.nxml', 100, None)
+        self.assertEqual(
+            self.store.get('a.tar.gz', 'J/article-1.nxml', 100),
+            RECORD
+        )
+        self.assertEqual(
+            self.store.get('a.tar.gz', 'J/article-2.nxml', 100),
+            None
+        )
+
+    def test_missing(self):
+        self.store.put('a.tar.gz', 'J/article-1.nxml', 100, RECORD)
+        self.assertRaises(KeyError, self.store.get,
+            'a.tar.gz', 'J/article-2.nxml', 100)
+        self.assertRaises(KeyError, self.store.get,
+            'b.tar.gz', 'J/article-1.nxml', 100)
+
+    def test_modified(self):
+        self.store.put('a.tar.gz', 'J/article-1.nxml', 100, RECORD)
+        self.assertRaises(KeyError, self.store.get,
+            'a.tar.gz', 'J/article-1.nxml', 200)
+        self.store.put('a.tar.gz', 'J/article-1.nxml', 200, None)
+        self.assertEqual(
+            self.store.get('a.tar.gz', 'J/article-1.nxml', 200),
+            None
+        )
+        self.assertRaises(KeyError, self.store.get,
+            'a.tar.gz', 'J/article-1.nxml', 100)
+
+    def test_reopen(self):
+        interval = records.COMMIT_INTERVAL
+        records.COMMIT_INTERVAL = 2
+        try:
+            for i in xrange(3):
+                self.store.put('a.tar.gz', 'J/article-%d.nxml' % i, 100, RECORD)
+            self.assertEqual(self.store.uncommitted, 1)
+        finally:
+            records.COMMIT_INTERVAL = interval
+        self.store.close()
+        self.store = RecordStore(self.filename)
+        for i in xrange(3):
+            self.assertEqual(
+                self.store.get('a.tar.gz', 'J/article-%d.nxml' % i, 100),
+                RECORD
+            )
+
+    def test_version(self):
+        self.store.close()
+        self.store = RecordStore(self.filename, '1-a')
+        self.store.put('a.tar.gz', 'J/article-1.nxml', 100, RECORD)
+        self.store.close()
+        self.store = RecordStore(self.filename, '1-a')
+        self.assertEqual(
+            self.store.get('a.tar.gz', 'J/article-1.nxml', 100),
+            RECORD
+        )
+        self.store.close()
+        # records extracted by other code are dropped
+        self.store = RecordStore(self.filename, '2-a')
+        self.assertRaises(KeyError, self.store.get,
+            'a.tar.gz', 'J/article-1.nxml', 100)
+
+class NoMediaStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'no-media.sqlite')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_put(self):
+        store = NoMediaStore(self.filename, '1-a')
+        store.put('J/article-1.nxml', 100)
+        store.put('J/article-2.nxml', 100)
+        store.put('J/article-2.nxml', 200)
+        store.close()
+        store = NoMediaStore(self.filename, '1-a')
+        self.assertEqual(store.get('J/article-1.nxml'), 100)
+        self.assertEqual(store.get('J/article-2.nxml'), 200)
+        self.assertEqual(store.get('J/article-3.nxml'), None)
+        store.close()
+        store = NoMediaStore(self.filename, '2-a')
+        self.assertEqual(store.get('J/article-1.nxml'), None)
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
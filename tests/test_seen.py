@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers.seen import BloomFilter, DiskSeenSet, seen_set
+
+NAMES = [u'J/article-%d.nxml' % i for i in xrange(1000)]
+UNSEEN = [u'J/other-%d.nxml' % i for i in xrange(1000)]
+
+class SeenTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = path.join(self.directory, 'seen')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(self.filename, len(NAMES))
+        try:
+            for name in NAMES:
+                bloom.add(name)
+            for name in NAMES:
+                self.assertTrue(name in bloom)
+            false_positives = len([name for name in UNSEEN if name in bloom])
+            self.assertTrue(false_positives <= 10)
+        finally:
+            bloom.close()
+
+    def test_disk_seen_set(self):
+        seen = DiskSeenSet(self.filename, len(NAMES))
+        try:
+            seen.update(NAMES[:500])
+            for name in NAMES[400:]:
+                seen.add(name)
+            seen.add(NAMES[0].encode('utf-8'))  # names as bytes are the same
+            self.assertEqual(len(seen), len(NAMES))
+            for name in NAMES:
+                self.assertTrue(name in seen)
+                self.assertTrue(name.encode('utf-8') in seen)
+            for name in UNSEEN:
+                self.assertFalse(name in seen)
+        finally:
+            seen.close()
+
+    def test_disk_seen_set_is_new(self):
+        seen = DiskSeenSet(self.filename, len(NAMES))
+        seen.update(NAMES)
+        seen.close()
+        seen = DiskSeenSet(self.filename, len(NAMES))
+        try:
+            self.assertEqual(len(seen), 0)
+            self.assertFalse(NAMES[0] in seen)
+        finally:
+            seen.close()
+
+    def test_seen_set(self):
+        self.assertEqual(seen_set(NAMES), set(NAMES))
+        seen = seen_set(NAMES, self.filename, len(NAMES))
+        try:
+            self.assertTrue(isinstance(seen, DiskSeenSet))
+            self.assertEqual(len(seen), len(NAMES))
+        finally:
+            seen.close()
+
+if __name__ == '__main__':
+    unittest.main()
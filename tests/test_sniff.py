@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from mimetools import Message
+from os import path
+from shutil import rmtree
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+import unittest
+
+from helpers import sniff
+from helpers.sniff import Sniffer, SniffCache
+
+CONTENT = 'x' * 5000 + 'END'
+
+class _Response(object):
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = StringIO(body)
+        self.headers = Message(StringIO(
+            ''.join('%s: %s\r\n' % item for item in headers.items()) + '\r\n'
+        ))
+
+    def read(self, amount=None):
+        return self.body.read(amount)
+
+    def close(self):
+        pass
+
+class _Connections(object):
+    """
+    Stands in for a connection pool, serving CONTENT with an ETag and
+    answering ranged and conditional requests like a server would.
+    """
+    def __init__(self):
+        self.requests = []
+        self.etag = '"1"'
+        self.ranges = True
+
+    def open(self, url, headers={}):
+        self.requests.append(dict(headers))
+        if headers.get('If-None-Match') == self.etag:
+            return _Response(304, '', {})
+        if not self.ranges:
+            return _Response(200, CONTENT, {'ETag': self.etag})
+        start, end = [int(n) for n in headers['Range'][6:].split('-')]
+        return _Response(206, CONTENT[start:end + 1], {'ETag': self.etag})
+
+def _detect(chunk):
+    # partial files look like truncated MS Office documents
+    if 'END' in chunk:
+        return 'text/plain'
+    return 'CDF V2 Document, corrupt: Cannot read summary info'
+
+class SnifferTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.now = 1000000.0
+        self.time = sniff.time
+        sniff.time = lambda: self.now
+        sniff.statistics.clear()
+        self.connections = _Connections()
+        self.cache = SniffCache(path.join(self.directory, 'sniff.sqlite'))
+        self.sniffer = Sniffer(self.connections, self.cache, 1000000)
+        self.sniffer._detect = _detect
+
+    def tearDown(self):
+        self.cache.close()
+        sniff.time = self.time
+        rmtree(self.directory)
+
+    def test_growing_ranges(self):
+        self.assertEqual(self.sniffer.sniff('http://example.org/a'),
+            'text/plain')
+        self.assertEqual(
+            [request['Range'] for request in self.connections.requests],
+            ['bytes=0-11', 'bytes=12-4095', 'bytes=4096-65535']
+        )
+        self.assertEqual(sniff.statistics['sniff-bytes']['requested'],
+            len(CONTENT))
+
+    def test_max_size(self):
+        self.sniffer = Sniffer(self.connections, self.cache, 100)
+        self.sniffer._detect = _detect
+        # incomplete documents are guessed from their extension
+        self.assertEqual(self.sniffer.sniff('http://example.org/a.xls'),
+            'application/vnd.ms-excel')
+        self.assertEqual(
+            [request['Range'] for request in self.connections.requests],
+            ['bytes=0-11', 'bytes=12-99']
+        )
+
+    def test_range_ignored(self):
+        self.connections.ranges = False
+        self.assertEqual(self.sniffer.sniff('http://example.org/a'),
+            'text/plain')
+        self.assertEqual(len(self.connections.requests), 3)
+        self.assertEqual(sniff.statistics['sniff-bytes']['requested'],
+            len(CONTENT))
+
+    def test_cached(self):
+        self.sniffer.sniff('http://example.org/a')
+        del self.connections.requests[:]
+        self.now += sniff.TTL - 1
+        self.assertEqual(self.sniffer.sniff('http://example.org/a'),
+            'text/plain')
+        self.assertEqual(self.connections.requests, [])
+        self.assertEqual(sniff.statistics['sniff']['cached'], 1)
+
+    def test_revalidated(self):
+        self.sniffer.sniff('http://example.org/a')
+        del self.connections.requests[:]
+        self.now += sniff.TTL
+        self.assertEqual(self.sniffer.sniff('http://example.org/a'),
+            'text/plain')
+        self.assertEqual(self.connections.requests, [
+            {'If-None-Match': '"1"', 'Range': 'bytes=0-11'}
+        ])
+        self.assertEqual(sniff.statistics['sniff']['revalidated'], 1)
+        # revalidation starts a new period without requests
+        self.now += sniff.TTL - 1
+        self.sniffer.sniff('http://example.org/a')
+        self.assertEqual(len(self.connections.requests), 1)
+
+    def test_changed(self):
+        self.sniffer.sniff('http://example.org/a')
+        del self.connections.requests[:]
+        self.connections.etag = '"2"'
+        self.now += sniff.TTL
+        self.sniffer._detect = lambda chunk: 'image/png'
+        self.assertEqual(self.sniffer.sniff('http://example.org/a'),
+            'image/png')
+        self.assertEqual(len(self.connections.requests), 1)
+        self.assertEqual(self.cache.get('http://example.org/a'),
+            (u'image/png', u'"2"', None, self.now))
+
+    def test_local(self):
+        filename = path.join(self.directory, 'a')
+        with open(filename, 'wb') as f:
+            f.write(CONTENT)
+        self.assertEqual(self.sniffer.sniff('http://example.org/a', filename),
+            'text/plain')
+        self.assertEqual(self.connections.requests, [])
+        self.assertEqual(sniff.statistics['sniff']['local'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from helpers import token_bucket
+from helpers.token_bucket import TokenBucket
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.waited = []
+        self.time = token_bucket.time
+        self.sleep = token_bucket.sleep
+        token_bucket.time = lambda: self.now
+        token_bucket.sleep = self.waited.append
+
+    def tearDown(self):
+        token_bucket.time = self.time
+        token_bucket.sleep = self.sleep
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        bucket.take(10 ** 9)
+        self.assertEqual(self.waited, [])
+
+    def test_rate(self):
+        bucket = TokenBucket(1000)
+        bucket.take(1000)  # a burst of one second
+        self.assertEqual(self.waited, [])
+        bucket.take(500)
+        self.assertEqual(self.waited, [0.5])
+        self.now += 0.5
+        bucket.take(250)
+        self.assertEqual(self.waited, [0.5, 0.25])
+
+    def test_burst(self):
+        bucket = TokenBucket(1000)
+        self.now += 60  # unused time does not add up beyond one second
+        bucket.take(2000)
+        self.assertEqual(self.waited, [1.0])
+
+    def test_capacity(self):
+        bucket = TokenBucket(3, 1)
+        self.now += 60
+        bucket.take()
+        self.assertEqual(self.waited, [])
+        # takers wait in turn for the tokens taken before them
+        bucket.take()
+        bucket.take()
+        self.assertEqual(self.waited, [1 / 3.0, 2 / 3.0])
+
+if __name__ == '__main__':
+    unittest.main()